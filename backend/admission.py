@@ -0,0 +1,176 @@
+"""Admission control for the generation endpoints.
+
+Two checks run before a request reaches its handler:
+
+- a token bucket per client, keyed by a configurable header (e.g. an API
+  key) or else the peer IP, which answers 429 once a client exceeds its rate;
+- a global cap on requests in flight. Requests over the cap wait in a short
+  FIFO queue; when the queue is full or the wait times out they get 503.
+
+Both rejections carry Retry-After, so well-behaved clients back off instead
+of piling onto an overloaded process and dragging everyone's latency up.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Optional, Sequence, Tuple
+
+from starlette.responses import JSONResponse
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class TokenBuckets:
+    """Per-key token buckets refilled at `rate` tokens/sec up to `burst`"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> (tokens, time of last refill); least recently seen first
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def take(self, key: str) -> float:
+        """Spend one token for `key`; returns 0 if allowed, else seconds until a token is available"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        # Forgetting an idle client only hands it a full bucket, which it would have refilled to anyway
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class ConcurrencyLimiter:
+    """At most `limit` holders at once, with up to `max_queue` callers waiting up to `timeout` seconds"""
+
+    def __init__(self, limit: int, max_queue: int, timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """Take a slot; returns whether the caller had to queue. Raises Overloaded if it can't get one."""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return False
+        if len(self._waiters) >= self.max_queue:
+            raise Overloaded('queue_full')
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters.append(future)
+        timer = loop.call_later(self.timeout, lambda: future.done() or future.set_exception(Overloaded('queue_timeout')))
+        try:
+            # release() hands its slot straight to the waiter, so in_flight is already counted
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Granted a slot just as we were cancelled; pass it on
+                self.release()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            raise
+        finally:
+            timer.cancel()
+        return True
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+def _rejection(status: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {'detail': detail}, status_code=status, headers={'Retry-After': str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying rate limits and the concurrency cap to paths under `prefixes`"""
+
+    def __init__(
+        self,
+        app,
+        buckets: TokenBuckets,
+        limiter: ConcurrencyLimiter,
+        outcomes,
+        prefixes: Sequence[str] = ('/api/generate-',),
+        key_header: Optional[str] = None,
+    ):
+        self.app = app
+        self.buckets = buckets
+        self.limiter = limiter
+        self.outcomes = outcomes
+        self.prefixes = tuple(prefixes)
+        self.key_header = key_header.lower().encode() if key_header else None
+
+    def client_key(self, scope) -> str:
+        if self.key_header:
+            for name, value in scope['headers']:
+                if name == self.key_header:
+                    return 'key:' + value.decode('latin-1')
+        client = scope.get('client')
+        return 'ip:' + (client[0] if client else 'unknown')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        if self.buckets.enabled:
+            wait = self.buckets.take(self.client_key(scope))
+            if wait:
+                self.outcomes.inc('rate_limited')
+                await _rejection(429, 'Rate limit exceeded', wait)(scope, receive, send)
+                return
+
+        if not self.limiter.enabled:
+            self.outcomes.inc('admitted')
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            queued = await self.limiter.acquire()
+        except Overloaded as e:
+            self.outcomes.inc(e.reason)
+            await _rejection(503, 'Server busy, retry shortly', self.limiter.timeout)(scope, receive, send)
+            return
+        if queued:
+            self.outcomes.inc('queued')
+        self.outcomes.inc('admitted')
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
@@ -0,0 +1,63 @@
+"""N single POST /api/generate-prompt calls vs. one POST /api/generate-prompts/batch
+
+Drives the app in-process over ASGI against in-memory storage that charges a
+fixed latency per round trip.
+
+    python -m benchmarks.batch_bench [--size 50] [--db-latency-ms 2] [--rounds 5]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+import server
+from benchmarks.common import MODES, SimulatedStorage, sample_payload
+
+
+def briefs(size: int) -> list:
+    return [sample_payload(MODES[i % len(MODES)], product=f"Product #{i}") for i in range(size)]
+
+
+async def run(size: int, latency: float, rounds: int) -> None:
+    server.storage = SimulatedStorage(latency)
+    server.render_cache.clear()
+    payloads = briefs(size)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        singles = []
+        batches = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for payload in payloads:
+                response = await client.post("/api/generate-prompt", json=payload)
+                response.raise_for_status()
+            singles.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            response = await client.post("/api/generate-prompts/batch", json=payloads)
+            response.raise_for_status()
+            assert response.json()["succeeded"] == size
+            batches.append(time.perf_counter() - start)
+
+    single = min(singles)
+    batch = min(batches)
+    print(f"batch size {size}, simulated DB latency {latency * 1000:.1f} ms, best of {rounds}")
+    print(f"{'':<10}{'total ms':>12}{'per item ms':>14}{'items/s':>12}")
+    print(f"{'single':<10}{single * 1000:>12.1f}{single * 1000 / size:>14.3f}{size / single:>12,.0f}")
+    print(f"{'batch':<10}{batch * 1000:>12.1f}{batch * 1000 / size:>14.3f}{size / batch:>12,.0f}")
+    print(f"speedup: {single / batch:.1f}x")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=50)
+    parser.add_argument("--db-latency-ms", type=float, default=2.0)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.size, args.db_latency_ms / 1000, args.rounds))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,69 @@
+"""Shared fixtures and timing helpers for the benchmarks"""
+import asyncio
+import logging
+import time
+from typing import Callable
+
+from storage import MemoryStorage
+
+# server.py configures INFO logging; keep per-request client logs out of the results
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+MODES = ["short_ad_copy", "visual_ad", "landing_page_copy", "headlines"]
+
+# Same sample brief backend_test.py sends to the live API
+SAMPLE_BRIEF = {
+    "product": "AI-powered fitness tracking app",
+    "offer": "Get personalized workout plans for 50% off first month",
+    "audience": "Health-conscious millennials aged 25-35",
+    "brand_voice": "Motivational, data-driven, friendly",
+    "channel": "Meta, Instagram",
+    "objective": "CTR optimization",
+    "market": "United States",
+    "language": "English",
+    "constraints": "",
+    "competitive_angle": "",
+    "references": "",
+}
+
+
+def sample_payload(mode: str, **overrides) -> dict:
+    """A generate-prompt request body for `mode`"""
+    payload = {"mode": mode, **SAMPLE_BRIEF}
+    payload.update(overrides)
+    return payload
+
+
+def ops_per_second(func: Callable[[], object], min_time: float = 0.5) -> float:
+    """Call `func` repeatedly for at least `min_time` seconds and return calls/sec"""
+    func()  # warm up
+    calls = 0
+    batch = 1
+    start = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            func()
+        calls += batch
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return calls / elapsed
+        batch *= 2
+
+
+class SimulatedStorage(MemoryStorage):
+    """In-memory storage that charges a fixed round-trip latency per write, like a remote database"""
+
+    def __init__(self, latency: float = 0.002):
+        super().__init__()
+        self.latency = latency
+        self.round_trips = 0
+
+    async def insert(self, collection, document):
+        await asyncio.sleep(self.latency)
+        self.round_trips += 1
+        await super().insert(collection, document)
+
+    async def insert_many(self, collection, documents):
+        await asyncio.sleep(self.latency)
+        self.round_trips += 1
+        return await super().insert_many(collection, documents)
@@ -0,0 +1,190 @@
+"""Concurrent load test for the API with throughput and latency percentiles
+
+By default the app is driven in-process over ASGI with STORAGE_BACKEND=memory,
+so no database or network is involved; pass --url to load a running server
+(e.g. a local `uvicorn server:app`) instead. Each scenario runs its requests
+from --concurrency workers and reports requests/sec and p50/p95/p99 latency.
+
+    python -m benchmarks.load_suite [--requests 400] [--concurrency 16] [--only generate]
+    python -m benchmarks.load_suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.load_suite --baseline benchmarks/baseline.json --max-regression 0.25
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks.common import MODES, sample_payload
+
+# A scenario builds one request from a sequence number: (method, path, json body or None)
+Scenario = Callable[[int], tuple]
+
+
+def generate(mode: str) -> Scenario:
+    # A distinct product per request keeps the render cache from turning this into a cache benchmark
+    return lambda i: ("POST", "/api/generate-prompt", sample_payload(mode, product=f"Product #{i}"))
+
+
+def batch(size: int) -> Scenario:
+    return lambda i: (
+        "POST",
+        "/api/generate-prompts/batch",
+        [sample_payload(MODES[j % len(MODES)], product=f"Product #{i}-{j}") for j in range(size)],
+    )
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "root": lambda i: ("GET", "/api/", None),
+    **{f"generate:{mode}": generate(mode) for mode in MODES},
+    "generate:batch10": batch(10),
+    "prompts:list": lambda i: ("GET", "/api/prompts?limit=100", None),
+    "prompts:list:mode": lambda i: ("GET", "/api/prompts?limit=100&mode=headlines", None),
+    "analytics:usage": lambda i: ("GET", "/api/analytics/usage?dimension=channel&days=30", None),
+    "status:create": lambda i: ("POST", "/api/status", {"client_name": f"load_client_{i % 50}"}),
+    "status:list": lambda i: ("GET", "/api/status?limit=100", None),
+    "status:summary": lambda i: ("GET", "/api/status/summary?granularity=minute&buckets=60", None),
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int) -> dict:
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            method, path, body = scenario(i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run(args) -> Dict[str, dict]:
+    names = [name for name in SCENARIOS if not args.only or any(name.startswith(prefix) for prefix in args.only)]
+    app = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+    else:
+        # Must be set before server is imported; it picks its backend at import time
+        os.environ["STORAGE_BACKEND"] = args.storage
+        import server
+
+        app = server.app
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load", timeout=30)
+
+    results = {}
+    try:
+        # Seed some history so the list scenarios have pages to read
+        await run_scenario(client, generate("headlines"), 200, args.concurrency)
+        await run_scenario(client, SCENARIOS["status:create"], 200, args.concurrency)
+        for name in names:
+            await run_scenario(client, SCENARIOS[name], max(1, args.requests // 10), args.concurrency)  # warm up
+            results[name] = await run_scenario(client, SCENARIOS[name], args.requests, args.concurrency)
+            print_row(name, results[name])
+    finally:
+        await client.aclose()
+        if app is not None:
+            await app.router.shutdown()
+    return results
+
+
+def print_row(name: str, result: dict) -> None:
+    print(
+        f"{name:<28}{result['rps']:>10,.0f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+        f"{result['p99_ms']:>10.2f}{result['errors']:>8}"
+    )
+
+
+def regressions(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Scenarios whose throughput fell or p95 latency rose by more than `tolerance` vs. the baseline"""
+    failures = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if result["errors"] > previous.get("errors", 0):
+            failures.append(f"{name}: {result['errors']} errors (baseline {previous.get('errors', 0)})")
+        if result["rps"] < previous["rps"] * (1 - tolerance):
+            failures.append(f"{name}: {result['rps']:,.0f} req/s vs baseline {previous['rps']:,.0f}")
+        if result["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            failures.append(f"{name}: p95 {result['p95_ms']:.2f} ms vs baseline {previous['p95_ms']:.2f} ms")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="load a running server instead of the in-process app")
+    parser.add_argument("--storage", default="memory", choices=["memory", "sqlite", "mongo"],
+                        help="storage backend for the in-process app")
+    parser.add_argument("--requests", type=int, default=400, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--only", nargs="*", help="scenario name prefixes to run, e.g. generate prompts:list")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed fractional drop in req/s or rise in p95 before failing")
+    parser.add_argument("--save-baseline", help="write these results as a new baseline")
+    args = parser.parse_args(argv)
+
+    print(f"{args.requests} requests per scenario, concurrency {args.concurrency}, "
+          f"target {args.url or f'in-process ({args.storage})'}")
+    print(f"{'scenario':<28}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    results = asyncio.run(run(args))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    failed = any(result["errors"] for result in results.values())
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = regressions(results, json.load(f), args.max_regression)
+        if failures:
+            print(f"\n❌ Regressions beyond {args.max_regression:.0%} of baseline:")
+            for failure in failures:
+                print(f"   • {failure}")
+            failed = True
+        else:
+            print(f"\n✅ Within {args.max_regression:.0%} of baseline")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
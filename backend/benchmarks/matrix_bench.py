@@ -0,0 +1,104 @@
+"""A market x language x channel matrix: per-combination rendering vs. POST /api/generate-prompts/matrix
+
+Compares rendering every combination in full against binding the invariant
+fields once, then times the matrix endpoint against the same combinations
+posted one at a time, in-process over ASGI against in-memory storage that
+charges a fixed latency per round trip. The render cache is disabled so every
+combination is really rendered.
+
+    python -m benchmarks.matrix_bench [--markets 5] [--languages 4] [--channels 6] [--db-latency-ms 2]
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+import httpx
+
+import server
+from benchmarks.common import SimulatedStorage, ops_per_second, sample_payload
+
+MODE = "short_ad_copy"
+
+
+def axes(markets: int, languages: int, channels: int) -> dict:
+    return {
+        "market": [f"Market {i}" for i in range(markets)],
+        "language": [f"Language {i}" for i in range(languages)],
+        "channel": [f"Channel {i}" for i in range(channels)],
+    }
+
+
+def render_rates(vary: dict, min_time: float) -> None:
+    base = server.PromptRequest(**sample_payload(MODE))
+    template = server.TEMPLATES.current_template(MODE)
+    combinations = [dict(zip(vary, values)) for values in itertools.product(*vary.values())]
+
+    def full():
+        return [template.render(server.prompt_values(base.model_copy(update=values))) for values in combinations]
+
+    def bound():
+        invariant = {field: value for field, value in server.prompt_values(base).items() if field not in vary}
+        partial = template.bind(invariant)
+        return [partial.render(values) for values in combinations]
+
+    if full() != bound():
+        raise SystemExit("❌ bound rendering differs from full rendering")
+    full_rate = ops_per_second(full, min_time)
+    bound_rate = ops_per_second(bound, min_time)
+    print(f"rendering {len(combinations)} combinations")
+    print(f"{'':<10}{'matrices/s':>12}{'per prompt us':>16}")
+    print(f"{'full':<10}{full_rate:>12,.0f}{1e6 / full_rate / len(combinations):>16.2f}")
+    print(f"{'bound':<10}{bound_rate:>12,.0f}{1e6 / bound_rate / len(combinations):>16.2f}")
+    print(f"speedup: {bound_rate / full_rate:.1f}x\n")
+
+
+async def endpoint_times(vary: dict, latency: float, rounds: int) -> None:
+    server.storage = SimulatedStorage(latency)
+    base = sample_payload(MODE)
+    combinations = [dict(zip(vary, values)) for values in itertools.product(*vary.values())]
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        singles = []
+        matrices = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for values in combinations:
+                response = await client.post("/api/generate-prompt", json={**base, **values})
+                response.raise_for_status()
+            singles.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            response = await client.post("/api/generate-prompts/matrix", json={"base": base, "vary": vary})
+            response.raise_for_status()
+            assert response.json()["succeeded"] == len(combinations)
+            matrices.append(time.perf_counter() - start)
+
+    single = min(singles)
+    matrix = min(matrices)
+    print(f"endpoint, simulated DB latency {latency * 1000:.1f} ms, best of {rounds}")
+    print(f"{'':<10}{'total ms':>12}{'per prompt ms':>16}")
+    print(f"{'single':<10}{single * 1000:>12.1f}{single * 1000 / len(combinations):>16.3f}")
+    print(f"{'matrix':<10}{matrix * 1000:>12.1f}{matrix * 1000 / len(combinations):>16.3f}")
+    print(f"speedup: {single / matrix:.1f}x")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--markets", type=int, default=5)
+    parser.add_argument("--languages", type=int, default=4)
+    parser.add_argument("--channels", type=int, default=6)
+    parser.add_argument("--db-latency-ms", type=float, default=2.0)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to run each rendering case")
+    args = parser.parse_args()
+
+    server.render_cache.max_entries = 0
+    vary = axes(args.markets, args.languages, args.channels)
+    render_rates(vary, args.min_time)
+    asyncio.run(endpoint_times(vary, args.db_latency_ms / 1000, args.rounds))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
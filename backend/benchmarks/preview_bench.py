@@ -0,0 +1,94 @@
+"""Live preview while typing: POST /api/generate-prompt per keystroke vs. patches over /api/preview
+
+Types a product name and an offer one character at a time. Each keystroke
+either posts the whole brief to /api/generate-prompt (full render plus a
+write to in-memory storage that charges a fixed latency per round trip) or
+sends the changed field over the preview WebSocket, which re-renders only the
+segments that use it. Both run in-process through Starlette's TestClient.
+
+    python -m benchmarks.preview_bench [--mode visual_ad] [--db-latency-ms 2]
+"""
+import argparse
+import json
+import time
+
+from starlette.testclient import TestClient
+
+import server
+from benchmarks.common import MODES, SimulatedStorage, sample_payload
+
+TYPED = {
+    "product": "Cold brew coffee subscription for remote teams",
+    "offer": "First month free, then 20% off every delivery",
+}
+
+
+def keystrokes():
+    """(field, value so far) after each typed character"""
+    for field, text in TYPED.items():
+        for end in range(1, len(text) + 1):
+            yield field, text[:end]
+
+
+def post_each(client: TestClient, brief: dict) -> tuple:
+    brief = dict(brief)
+    sent = received = 0
+    start = time.perf_counter()
+    for field, value in keystrokes():
+        brief[field] = value
+        body = json.dumps(brief)
+        response = client.post("/api/generate-prompt", content=body, headers={"Content-Type": "application/json"})
+        response.raise_for_status()
+        sent += len(body)
+        received += len(response.content)
+    return time.perf_counter() - start, sent, received, response.json()["generated_prompt"]
+
+
+def preview(client: TestClient, brief: dict) -> tuple:
+    sent = received = 0
+    with client.websocket_connect("/api/preview") as websocket:
+        websocket.send_text(json.dumps({"type": "update", "fields": brief}))
+        segments = json.loads(websocket.receive_text())["segments"]
+        start = time.perf_counter()
+        for seq, (field, value) in enumerate(keystrokes()):
+            message = json.dumps({"type": "update", "seq": seq, "fields": {field: value}})
+            websocket.send_text(message)
+            reply = websocket.receive_text()
+            sent += len(message)
+            received += len(reply)
+            for index, text in json.loads(reply)["segments"]:
+                segments[index] = text
+        elapsed = time.perf_counter() - start
+    return elapsed, sent, received, "".join(segments)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", default="visual_ad", choices=MODES)
+    parser.add_argument("--db-latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    server.render_cache.max_entries = 0
+    server.storage = storage = SimulatedStorage(args.db_latency_ms / 1000)
+    brief = sample_payload(args.mode)
+    count = sum(1 for _ in keystrokes())
+    with TestClient(server.app) as client:
+        post_time, post_sent, post_received, posted = post_each(client, brief)
+        writes = storage.round_trips
+        preview_time, preview_sent, preview_received, previewed = preview(client, brief)
+    if previewed != posted:
+        raise SystemExit("❌ patched preview differs from the rendered prompt")
+
+    print(f"{count} keystrokes, mode {args.mode}, simulated DB latency {args.db_latency_ms:.1f} ms")
+    print(f"{'':<10}{'per key ms':>12}{'sent B/key':>12}{'recv B/key':>12}{'DB writes':>11}")
+    for name, elapsed, sent, received, db_writes in (
+        ("post", post_time, post_sent, post_received, writes),
+        ("preview", preview_time, preview_sent, preview_received, storage.round_trips - writes),
+    ):
+        print(f"{name:<10}{elapsed * 1000 / count:>12.3f}{sent / count:>12.0f}{received / count:>12.0f}{db_writes:>11}")
+    print(f"speedup: {post_time / preview_time:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
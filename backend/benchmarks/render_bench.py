@@ -0,0 +1,60 @@
+"""Renders/sec per mode: per-request str.format vs. precompiled templates vs. the render cache
+
+The cache columns run generate_prompt: `hit/s` with the cache on and the same
+brief every time, `unique/s` and `uncached/s` with a different brief every
+time (as for most real traffic) and the cache on and off. The cache is only
+worth enabling where hits gain more than `unique/s` loses to `uncached/s`.
+
+    python -m benchmarks.render_bench [--min-time 1.0]
+"""
+import argparse
+import itertools
+
+import server
+from benchmarks.common import MODES, ops_per_second, sample_payload
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to run each case")
+    args = parser.parse_args()
+
+    server.render_cache.max_entries = 1024
+    print(f"{'mode':<20}{'str.format/s':>16}{'compiled/s':>16}{'speedup':>10}{'hit/s':>16}{'unique/s':>16}{'uncached/s':>16}")
+    for mode in MODES:
+        request = server.PromptRequest(**sample_payload(mode))
+        template = server.MASTER_PROMPTS[mode]
+        compiled_template = server.TEMPLATES.current_template(mode)
+        unique_requests = itertools.cycle([
+            server.PromptRequest(**sample_payload(mode, product=f"Product {i}")) for i in range(100000)
+        ])
+
+        def legacy():
+            return template.format(**server.prompt_values(request))
+
+        def compiled():
+            return compiled_template.render(server.prompt_values(request))
+
+        def hit():
+            return server.generate_prompt(request)
+
+        def unique():
+            return server.generate_prompt(next(unique_requests))
+
+        server.render_cache.clear()
+        legacy_rate = ops_per_second(legacy, args.min_time)
+        compiled_rate = ops_per_second(compiled, args.min_time)
+        hit_rate = ops_per_second(hit, args.min_time)
+        unique_rate = ops_per_second(unique, args.min_time)
+        server.render_cache.max_entries = 0
+        uncached_rate = ops_per_second(unique, args.min_time)
+        server.render_cache.max_entries = 1024
+        print(
+            f"{mode:<20}{legacy_rate:>16,.0f}{compiled_rate:>16,.0f}"
+            f"{compiled_rate / legacy_rate:>9.2f}x{hit_rate:>16,.0f}{unique_rate:>16,.0f}{uncached_rate:>16,.0f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,62 @@
+"""Offline rendering throughput of render_briefs.py by worker count
+
+Writes --rows synthetic briefs to a temporary CSV, then renders it to NDJSON
+with each worker count and reports rows/sec and scaling efficiency against
+one worker. Worker start-up (importing the app) is included, as in a real run.
+
+    python -m benchmarks.render_scaling_bench [--rows 200000] [--workers 1 2 4 8]
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import render_briefs
+from benchmarks.common import MODES, sample_payload
+
+
+def write_briefs(path: Path, rows: int) -> None:
+    rng = random.Random(3)
+    fields = list(sample_payload(MODES[0]))
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        for i in range(rows):
+            writer.writerow(sample_payload(rng.choice(MODES), product=f"Product {i}", offer=f"{rng.randint(5, 60)}% off"))
+
+
+def run(path: Path, workers: int, chunk_size: int) -> float:
+    start = time.perf_counter()
+    rendered = 0
+    for records, errors in render_briefs.render_all(path, "csv", chunk_size, workers, encode=True):
+        rendered += records.count(b"\n")
+        if errors:
+            raise SystemExit(f"❌ {len(errors)} rows failed: {errors[0]}")
+    return rendered / (time.perf_counter() - start)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="*", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "briefs.csv"
+        write_briefs(path, args.rows)
+        print(f"{args.rows:,} rows, chunks of {args.chunk_size}, {os.cpu_count()} CPUs")
+        print(f"{'workers':<10}{'rows/s':>12}{'efficiency':>12}")
+        baseline = None
+        for workers in args.workers:
+            rate = run(path, workers, args.chunk_size)
+            baseline = baseline or rate / workers
+            print(f"{workers:<10}{rate:>12,.0f}{rate / (baseline * workers):>12.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,95 @@
+"""Search latency against the in-process inverted index (memory) and SQLite FTS5
+
+Loads --documents synthetic prompt documents straight into storage, then
+times one- and three-word queries through `Storage.search`. Products draw from
+a small vocabulary, so every query word matches about 8% of the documents:
+a worst case for ranking compared with real, mostly distinctive brief text.
+
+    python -m benchmarks.search_bench [--documents 200000] [--storage memory sqlite]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import server
+from storage import MemoryStorage, Query, SQLiteStorage
+
+WORDS = (
+    "fitness coffee vegan protein running shoes trail yoga mat skincare serum organic tea budget travel luxury "
+    "watch smart home camera pet food kids toys gaming laptop headphones bike helmet meal kit fashion denim "
+    "jacket candle mortgage insurance banking app crypto wallet language course piano lessons dental clinic"
+).split()
+AUDIENCES = ["busy parents", "college students", "remote workers", "retirees", "small business owners", "gen z gamers"]
+
+QUERIES = {
+    "one word": "piano",
+    "three words": "vegan protein running",
+}
+
+
+def documents(count: int):
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(count):
+        product = " ".join(rng.sample(WORDS, 3))
+        yield {
+            "id": f"{i:09d}",
+            "mode": "headlines",
+            "timestamp": start + timedelta(seconds=i),
+            "template_version": server.TEMPLATES.current["headlines"],
+            "request_data": {
+                "product": product.title(),
+                "offer": f"{rng.randint(10, 60)}% off {rng.choice(WORDS)}",
+                "audience": rng.choice(AUDIENCES),
+                "brand_voice": "Bold, friendly",
+            },
+        }
+
+
+async def run(backend: str, count: int, repeats: int) -> None:
+    if backend == "memory":
+        storage = MemoryStorage()
+    else:
+        storage = SQLiteStorage(os.path.join(tempfile.mkdtemp(), "search.db"))
+    await storage.ensure_text_index("prompts", server.SEARCH_FIELDS)
+    start = time.perf_counter()
+    batch = []
+    for document in documents(count):
+        batch.append(document)
+        if len(batch) == 10000:
+            await storage.insert_many("prompts", batch)
+            batch = []
+    if batch:
+        await storage.insert_many("prompts", batch)
+    print(f"{backend}: loaded {count:,} documents in {time.perf_counter() - start:.1f}s")
+    for name, text in QUERIES.items():
+        for query in (Query(), Query(since=datetime(2024, 1, 2, tzinfo=timezone.utc))):
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                results = await storage.search("prompts", text, query, 20)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            label = f"{name}{' +since' if query.since else ''}"
+            print(f"  {label:<20}{len(results):>4} hits  p50 {timings[len(timings) // 2] * 1000:>8.2f} ms"
+                  f"  max {timings[-1] * 1000:>8.2f} ms")
+    await storage.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=200000)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--storage", nargs="*", default=["memory", "sqlite"], choices=["memory", "sqlite"])
+    args = parser.parse_args()
+    for backend in args.storage:
+        asyncio.run(run(backend, args.documents, args.repeats))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
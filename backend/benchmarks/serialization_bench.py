@@ -0,0 +1,88 @@
+"""CPU time per request for the list endpoints: Pydantic round-trips vs. the direct orjson path
+
+The "pydantic" column serves the same rows the way the list endpoints used to:
+one model per row, returned through response_model and FastAPI's default
+JSONResponse. The "fast" column is the current endpoint. Both read from the
+same in-memory storage so only serialization differs.
+
+    python -m benchmarks.serialization_bench [--requests 50]
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import Optional
+
+os.environ["STORAGE_BACKEND"] = "memory"
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+import server
+from benchmarks.common import MODES, sample_payload
+from pagination import next_cursor
+
+
+def legacy_app() -> FastAPI:
+    app = FastAPI(default_response_class=JSONResponse)
+
+    @app.get("/api/prompts", response_model=server.PromptPage)
+    async def get_prompts(limit: int = 100, cursor: Optional[str] = None):
+        prompts = await server.storage.find_page("prompts", server.page_query(cursor, None, None), limit + 1)
+        return server.PromptPage(
+            items=[server.PromptResponse(**server.hydrate_prompt(prompt)) for prompt in prompts[:limit]],
+            next_cursor=next_cursor(prompts, limit),
+        )
+
+    @app.get("/api/status", response_model=server.StatusCheckPage)
+    async def get_status_checks(limit: int = 100, cursor: Optional[str] = None):
+        rows = await server.storage.find_page("status_checks", server.page_query(cursor, None, None), limit + 1)
+        return server.StatusCheckPage(
+            items=[server.StatusCheck(**row) for row in rows[:limit]],
+            next_cursor=next_cursor(rows, limit),
+        )
+
+    return app
+
+
+async def cpu_ms_per_request(app, path: str, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        first = await client.get(path)
+        first.raise_for_status()
+        start = time.process_time()
+        for _ in range(requests):
+            await client.get(path)
+        return (time.process_time() - start) * 1000 / requests
+
+
+async def run(requests: int) -> None:
+    await server.app.router.startup()
+    for i in range(1000):
+        request = server.PromptRequest(**sample_payload(MODES[i % len(MODES)], product=f"Product #{i}"))
+        response = server.PromptResponse(mode=request.mode, generated_prompt="")
+        await server.storage.insert("prompts", server.prompt_document(response, request))
+        await server.storage.insert("status_checks", server.StatusCheck(client_name=f"client_{i % 20}").model_dump())
+
+    legacy = legacy_app()
+    print(f"{'endpoint':<28}{'pydantic ms':>14}{'fast ms':>12}{'speedup':>10}")
+    for endpoint in ("/api/prompts", "/api/status"):
+        for rows in (100, 1000):
+            path = f"{endpoint}?limit={rows}"
+            before = await cpu_ms_per_request(legacy, path, requests)
+            after = await cpu_ms_per_request(server.app, path, requests)
+            print(f"{path:<28}{before:>14.2f}{after:>12.2f}{before / after:>9.2f}x")
+    await server.app.router.shutdown()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50, help="requests per measurement")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
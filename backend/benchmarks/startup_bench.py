@@ -0,0 +1,119 @@
+"""Cold-start cost: `import server` time and time to first successful request
+
+Each run is a fresh interpreter, as on a new autoscaled or serverless instance.
+Import time is measured inside a subprocess; time to first request is measured
+from launching `uvicorn server:app` until GET /api/ and then a
+POST /api/generate-prompt succeed. Exits non-zero when a median exceeds its
+budget, so it can gate CI.
+
+    python -m benchmarks.startup_bench [--runs 5] [--storage memory]
+    python -m benchmarks.startup_bench --import-budget-ms 800 --first-request-budget-ms 2000
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.common import sample_payload
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import server; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def child_env(storage: str) -> dict:
+    return {**os.environ, "STORAGE_BACKEND": storage}
+
+
+def import_seconds(storage: str) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=BACKEND_DIR, env=child_env(storage), capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(port: int, method: str, path: str, body=None) -> int:
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        payload = json.dumps(body).encode() if body is not None else None
+        connection.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+
+def first_request_seconds(storage: str, timeout: float) -> tuple:
+    """(seconds until GET /api/ succeeds, seconds until the first generate succeeds) after launch"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=child_env(storage), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f"server did not answer within {timeout}s")
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with status {process.returncode}")
+            try:
+                if request(port, "GET", "/api/") == 200:
+                    break
+            except OSError:
+                time.sleep(0.005)
+        ready = time.perf_counter() - start
+        status = request(port, "POST", "/api/generate-prompt", sample_payload("headlines"))
+        if status != 200:
+            raise RuntimeError(f"first generate returned {status}")
+        return ready, time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--storage", default="memory", choices=["memory", "sqlite", "mongo"])
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for the server to answer")
+    parser.add_argument("--import-budget-ms", type=float, default=1500.0)
+    parser.add_argument("--first-request-budget-ms", type=float, default=3000.0)
+    args = parser.parse_args()
+
+    imports = [import_seconds(args.storage) for _ in range(args.runs)]
+    firsts = [first_request_seconds(args.storage, args.timeout) for _ in range(args.runs)]
+    results = {
+        "import server": (statistics.median(imports), args.import_budget_ms),
+        "first GET /api/": (statistics.median(ready for ready, _ in firsts), None),
+        "first generate": (statistics.median(generate for _, generate in firsts), args.first_request_budget_ms),
+    }
+
+    print(f"{args.runs} cold starts, storage {args.storage}")
+    print(f"{'':<20}{'median ms':>12}{'budget ms':>12}")
+    failed = False
+    for name, (seconds, budget) in results.items():
+        over = budget is not None and seconds * 1000 > budget
+        failed = failed or over
+        budget_text = f"{budget:.0f}" if budget is not None else "-"
+        print(f"{name:<20}{seconds * 1000:>12.1f}{budget_text:>12}{'  ❌ over budget' if over else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,60 @@
+"""Conditional GET support for the list endpoints.
+
+Each collection has a `ChangeMarker` that write paths bump after a successful
+insert. A listing's ETag combines the marker's version with the query string,
+so a client polling with If-None-Match (or If-Modified-Since) can be answered
+with 304 Not Modified straight from memory, without a storage read.
+
+Markers live in process memory: they are exact when one process serves the
+writes, as in the default single-worker deployment. The per-process boot id in
+every ETag means a restart never validates an ETag issued before it.
+"""
+import hashlib
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Mapping
+
+BOOT_ID = uuid.uuid4().hex[:8]
+
+
+class ChangeMarker:
+    def __init__(self):
+        self.version = 0
+        self.last_modified = datetime.now(timezone.utc)
+
+    def touch(self) -> None:
+        self.version += 1
+        self.last_modified = datetime.now(timezone.utc)
+
+    def etag(self, query_string: str = '') -> str:
+        # The query selects the page/filter, so it is part of the representation
+        query = hashlib.blake2b(query_string.encode(), digest_size=6).hexdigest()
+        return f'W/"{BOOT_ID}-{self.version}-{query}"'
+
+    def headers(self, query_string: str = '') -> Dict[str, str]:
+        return {
+            'ETag': self.etag(query_string),
+            'Last-Modified': format_datetime(self.last_modified, usegmt=True),
+            'Cache-Control': 'no-cache',
+        }
+
+
+def is_not_modified(request_headers: Mapping[str, str], response_headers: Mapping[str, str], marker: ChangeMarker) -> bool:
+    """Whether the client's cached copy is current; If-None-Match takes precedence over If-Modified-Since"""
+    if_none_match = request_headers.get('if-none-match')
+    if if_none_match is not None:
+        etag = response_headers['ETag']
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        # Weak comparison: W/"x" and "x" match
+        return '*' in candidates or any(tag.removeprefix('W/') == etag.removeprefix('W/') for tag in candidates)
+    if_modified_since = request_headers.get('if-modified-since')
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return marker.last_modified.replace(microsecond=0) <= since
+    return False
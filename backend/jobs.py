@@ -0,0 +1,243 @@
+"""Background jobs for bulk brief uploads.
+
+An upload is streamed to a temporary file, then a job reads it back in
+chunks of rows, so neither the request nor the job holds the whole file in
+memory. `Job` carries the progress counters GET /api/jobs/{id} reports;
+`JobRegistry` keeps recent jobs in process memory.
+"""
+import csv
+import io
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import AsyncIterator, BinaryIO, Iterator, List, Optional, Tuple
+
+FORMATS = ('csv', 'ndjson')
+
+# (row number, parsed row or None, parse error or None)
+Row = Tuple[int, Optional[dict], Optional[str]]
+
+
+class Job:
+    def __init__(self, format: str, filename: Optional[str], path: str, size: int, max_errors: int = 100):
+        self.id = str(uuid.uuid4())
+        self.format = format
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.max_errors = max_errors
+        self.status = 'queued'
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.rows_read = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.bytes_read = 0
+        # First max_errors failures: {'row': n, 'error': message}
+        self.errors: List[dict] = []
+        self.message: Optional[str] = None
+        self._started = 0.0
+        self._elapsed = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def start(self) -> None:
+        self.status = 'running'
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+
+    def finish(self, message: Optional[str] = None) -> None:
+        self.status = 'failed' if message else 'completed'
+        self.message = message
+        self.finished_at = datetime.now(timezone.utc)
+        # A queued job can be finished (interrupted) without ever starting
+        self._elapsed = time.perf_counter() - self._started if self._started else 0.0
+
+    def record_error(self, row: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row, 'error': error})
+
+    def to_dict(self) -> dict:
+        elapsed = self._elapsed if self.finished else (time.perf_counter() - self._started if self._started else 0.0)
+        return {
+            'id': self.id,
+            'status': self.status,
+            'format': self.format,
+            'filename': self.filename,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'rows_read': self.rows_read,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'progress': min(1.0, self.bytes_read / self.size) if self.size else 1.0,
+            'rows_per_second': self.rows_read / elapsed if elapsed else 0.0,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'message': self.message,
+        }
+
+
+class JobRegistry:
+    """Jobs by id; only the most recent `max_finished` finished jobs are kept"""
+
+    def __init__(self, max_finished: int = 100):
+        self.max_finished = max_finished
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    def add(self, job: Job) -> Job:
+        self._jobs[job.id] = job
+        finished = [id for id, existing in self._jobs.items() if existing.finished]
+        for id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[id]
+        return job
+
+    def get(self, id: str) -> Optional[Job]:
+        return self._jobs.get(id)
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+async def receive_upload(
+    chunks: AsyncIterator[bytes], content_type: str, destination: BinaryIO, field: str = 'file', max_bytes: int = 0
+) -> Tuple[Optional[str], Optional[str], int]:
+    """Stream a multipart/form-data body, writing the `field` file part to `destination` as it arrives.
+
+    Returns (filename, part content type, bytes written). Other parts are
+    ignored. Raises UploadError if the body is malformed, has no such part or
+    the part exceeds `max_bytes` (0 for no limit).
+    """
+    from multipart.multipart import MultipartParser, parse_options_header
+
+    media_type, options = parse_options_header(content_type)
+    if media_type != b'multipart/form-data' or b'boundary' not in options:
+        raise UploadError("Expected a multipart/form-data upload")
+
+    state = {'headers': {}, 'field': b'', 'value': b'', 'match': False, 'found': False, 'size': 0}
+    part = {'filename': None, 'content_type': None}
+
+    def on_part_begin():
+        state['headers'] = {}
+        state['match'] = False
+
+    def on_header_field(data, start, end):
+        state['field'] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state['value'] += data[start:end]
+
+    def on_header_end():
+        state['headers'][state['field'].lower()] = state['value']
+        state['field'] = state['value'] = b''
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state['headers'].get(b'content-disposition', b''))
+        if disposition.get(b'name', b'').decode('latin-1') == field and not state['found']:
+            state['match'] = state['found'] = True
+            filename = disposition.get(b'filename')
+            part['filename'] = filename.decode('utf-8', 'replace') if filename is not None else None
+            part_type = state['headers'].get(b'content-type')
+            part['content_type'] = part_type.decode('latin-1') if part_type else None
+
+    def on_part_data(data, start, end):
+        if not state['match']:
+            return
+        state['size'] += end - start
+        if max_bytes and state['size'] > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+        destination.write(data[start:end])
+
+    parser = MultipartParser(options[b'boundary'], {
+        'on_part_begin': on_part_begin,
+        'on_header_field': on_header_field,
+        'on_header_value': on_header_value,
+        'on_header_end': on_header_end,
+        'on_headers_finished': on_headers_finished,
+        'on_part_data': on_part_data,
+    })
+    try:
+        async for chunk in chunks:
+            parser.write(chunk)
+        parser.finalize()
+    except UploadError:
+        raise
+    except Exception as e:
+        raise UploadError(f"Malformed multipart body: {e}") from e
+    if not state['found']:
+        raise UploadError(f"No '{field}' file part in the upload")
+    return part['filename'], part['content_type'], state['size']
+
+
+def detect_format(format: Optional[str], filename: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    """The upload format from an explicit choice, the file extension or the part's content type"""
+    if format:
+        return format if format in FORMATS else None
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type == 'text/csv':
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/ndjson'):
+        return 'ndjson'
+    return None
+
+
+def read_rows(file: BinaryIO, format: str) -> Iterator[Row]:
+    """Parse rows one at a time. CSV columns are field names; empty cells fall back to the field default."""
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='' if format == 'csv' else None)
+    try:
+        if format == 'csv':
+            reader = csv.DictReader(text)
+            for number, row in enumerate(reader, start=1):
+                if None in row:
+                    yield number, None, "Row has more cells than the header"
+                    continue
+                yield number, {name: value for name, value in row.items() if value not in ('', None)}, None
+            return
+        for number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(row, dict):
+                yield number, None, "Expected a JSON object"
+                continue
+            yield number, row, None
+    finally:
+        # Leave `file` open for the caller; the wrapper would close it when collected
+        text.detach()
+
+
+def next_chunk(rows: Iterator[Row], size: int) -> List[Row]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+def remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
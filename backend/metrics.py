@@ -0,0 +1,239 @@
+"""Minimal in-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms keep their values in plain dicts keyed by
+label tuples, so recording a sample is a couple of dict operations and no
+locking (everything runs on the event loop). `MetricsMiddleware` records
+per-route request counts, latency and in-flight requests as a pure ASGI
+middleware, and `InstrumentedStorage` times every storage call and stream,
+adding it to the request's `db` stage when the request is being timed (see
+timing.py).
+"""
+import bisect
+import inspect
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from timing import add_stage
+
+# Seconds; tuned for an API whose handlers mostly finish in well under 100 ms
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, *labels: str, value: float) -> None:
+        self.values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class CallbackMetric(Metric):
+    """Counter or gauge whose samples are read from a callback at scrape time"""
+
+    def __init__(self, name, help, callback: Callable[[], Dict[Tuple[str, ...], float]], labelnames=(), kind='gauge'):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def samples(self):
+        for labels, value in self.callback().items():
+            yield f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (non-cumulative, last is +Inf), sum, count]
+        self.values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                yield f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {count}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, callback, labelnames=(), kind='gauge') -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, callback, labelnames, kind))
+
+    def expose(self) -> str:
+        return '\n'.join(metric.expose() for metric in self.metrics) + '\n'
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request count, latency and in-flight requests per route"""
+
+    def __init__(self, app, requests: Counter, latency: Histogram, in_flight: Gauge):
+        self.app = app
+        self.requests = requests
+        self.latency = latency
+        self.in_flight = in_flight
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        self.in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight.dec()
+            # The router stores the matched route in the scope; label by its template, not the raw path
+            route = scope.get('route')
+            path = getattr(route, 'path', None) or 'unmatched'
+            labels = (scope['method'], path, str(status))
+            self.requests.inc(*labels)
+            self.latency.observe(elapsed, *labels)
+
+
+class InstrumentedStorage:
+    """Wraps a storage backend and times each coroutine and async generator method by operation and collection"""
+
+    def __init__(self, storage, latency: Histogram):
+        self._storage = storage
+        self._latency = latency
+        self.name = storage.name
+
+    def __getattr__(self, name):
+        attribute = getattr(self._storage, name)
+        if name.startswith('_'):
+            return attribute
+        if inspect.iscoroutinefunction(attribute):
+            timed = self._timed_call(name, attribute)
+        elif inspect.isasyncgenfunction(attribute):
+            timed = self._timed_stream(name, attribute)
+        else:
+            return attribute
+        # Cache on the instance so the wrapper is built once per method
+        setattr(self, name, timed)
+        return timed
+
+    def _record(self, name: str, args: tuple, elapsed: float) -> None:
+        collection = args[0] if args and isinstance(args[0], str) else ''
+        self._latency.observe(elapsed, self.name, name, collection)
+        add_stage('db', elapsed)
+
+    def _timed_call(self, name: str, method):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                self._record(name, args, time.perf_counter() - start)
+        return timed
+
+    def _timed_stream(self, name: str, method):
+        async def timed(*args, **kwargs):
+            # Only time spent fetching counts, not the consumer's work between items;
+            # one sample per stream, recorded when it is exhausted or closed
+            items = method(*args, **kwargs)
+            elapsed = 0.0
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = await items.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield item
+            finally:
+                await items.aclose()
+                self._record(name, args, elapsed)
+        return timed
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Compact legacy prompt documents that store the full generated_prompt text.
+
+A document is compacted only when one of the known template versions for its
+mode re-renders its request_data to exactly the stored text; it is then
+rewritten to carry template_version instead of generated_prompt. Documents
+that no known version reproduces are left untouched and stay readable as-is.
+
+    python migrate_prompts.py [--batch-size 500] [--dry-run]
+"""
+import argparse
+import asyncio
+import sys
+
+import server
+from storage import Query
+
+
+async def load_all_template_versions() -> None:
+    await server.register_template_versions()
+    async for template in server.storage.stream('prompt_templates', Query()):
+        server.TEMPLATES.add(template['mode'], template['source'])
+
+
+def matching_version(document: dict):
+    """The template version that reproduces the stored prompt text, if any"""
+    try:
+        request = server.PromptRequest(**document['request_data'])
+    except Exception:
+        return None
+    for version, _, template in server.TEMPLATES.versions(document['mode']):
+        if template.render(server.prompt_values(request)) == document['generated_prompt']:
+            return version
+    return None
+
+
+async def compact(batch_size: int, dry_run: bool) -> dict:
+    await load_all_template_versions()
+    counts = {'scanned': 0, 'compacted': 0, 'unmatched': 0}
+    # Archived prompts are rendered on read just like hot ones
+    for collection in ('prompts', server.ARCHIVE_COLLECTION):
+        updates = []
+        async for document in server.storage.stream(collection, Query(), batch_size=batch_size):
+            if 'generated_prompt' not in document or 'request_data' not in document:
+                continue
+            counts['scanned'] += 1
+            version = matching_version(document)
+            if version is None:
+                counts['unmatched'] += 1
+                continue
+            counts['compacted'] += 1
+            updates.append((document['id'], {'template_version': version}, ['generated_prompt']))
+            if len(updates) >= batch_size:
+                if not dry_run:
+                    await server.storage.update_fields(collection, updates)
+                updates = []
+                print(f"  {counts['scanned']} scanned, {counts['compacted']} compacted")
+        if updates and not dry_run:
+            await server.storage.update_fields(collection, updates)
+    return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help='report what would change without writing')
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            return await compact(args.batch_size, args.dry_run)
+        finally:
+            await server.storage.close()
+
+    counts = asyncio.run(run())
+    prefix = "Would compact" if args.dry_run else "Compacted"
+    print(f"{prefix} {counts['compacted']} of {counts['scanned']} legacy prompts "
+          f"({counts['unmatched']} left as full text: no known template version reproduces them)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Keyset pagination over (timestamp, id), newest first.
+
+A cursor is the sort key of the last document on a page, encoded as an
+opaque URL-safe token. The next page starts strictly after that key, so every
+page is a bounded index range scan no matter how deep the client pages.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+# Sort order shared by the list queries and the compound indexes that serve them
+KEYSET_SORT = [("timestamp", -1), ("id", -1)]
+
+
+def encode_cursor(timestamp: datetime, id: str) -> str:
+    raw = json.dumps({"t": timestamp.isoformat(), "i": id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor; raises ValueError for malformed tokens"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["t"]), str(data["i"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def encode_offset_cursor(offset: int) -> str:
+    """Cursor for result lists ordered by something other than (timestamp, id), e.g. search relevance"""
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode()).decode().rstrip("=")
+
+
+def decode_offset_cursor(cursor: str) -> int:
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))["o"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+
+def keyset_query(
+    after: Optional[Tuple[datetime, str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    **equals,
+) -> dict:
+    """Mongo filter for one page: equality filters, a time range and the position after a decoded cursor"""
+    query = dict(equals)
+    time_range = {}
+    if since is not None:
+        time_range["$gte"] = since
+    if until is not None:
+        time_range["$lt"] = until
+    if time_range:
+        query["timestamp"] = time_range
+    if after is not None:
+        timestamp, id = after
+        position = {"$or": [{"timestamp": {"$lt": timestamp}}, {"timestamp": timestamp, "id": {"$lt": id}}]}
+        query = {"$and": [query, position]} if query else position
+    return query
+
+
+def next_cursor(documents: list, limit: int) -> Optional[str]:
+    """Cursor for the page after `documents`, fetched with limit + 1 to detect whether one exists"""
+    if len(documents) <= limit:
+        return None
+    last = documents[limit - 1]
+    return encode_cursor(last["timestamp"], last["id"])
@@ -0,0 +1,212 @@
+"""Precompiled rendering for the MASTER_PROMPTS templates.
+
+`str.format` re-parses the whole template on every call. The templates never
+change at runtime, so we parse each one once into a flat list of literal text
+and placeholder slots, and rendering becomes a single `"".join` over that list.
+
+Every template is identified by a hash of its source. Stored prompts record
+that version instead of the rendered text, and the registry keeps superseded
+versions so old documents re-render exactly as they were generated.
+"""
+import hashlib
+import re
+from string import Formatter
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+_formatter = Formatter()
+
+
+class CompiledTemplate:
+    """A template split into literal segments and placeholder slots"""
+
+    __slots__ = ("source", "parts", "slots", "fields", "field_slots")
+
+    def __init__(self, source: str):
+        self.source = source
+        # `parts` holds literal text, with None in every placeholder position.
+        # `slots` maps each of those positions to (field, conversion, format_spec).
+        self.parts: List[object] = []
+        self.slots: List[Tuple[int, str, str, str]] = []
+        for literal, field, format_spec, conversion in _formatter.parse(source):
+            if literal:
+                if self.parts and isinstance(self.parts[-1], str):
+                    self.parts[-1] += literal
+                else:
+                    self.parts.append(literal)
+            if field is None:
+                continue
+            if not field.isidentifier() or "{" in (format_spec or ""):
+                raise ValueError(f"Unsupported placeholder in template: {{{field}}}")
+            self.slots.append((len(self.parts), field, conversion or "", format_spec or ""))
+            self.parts.append(None)
+        self.fields = frozenset(field for _, field, _, _ in self.slots)
+        # field -> the slots that reference it
+        self.field_slots: Dict[str, List[Tuple[int, str, str, str]]] = {}
+        for slot in self.slots:
+            self.field_slots.setdefault(slot[1], []).append(slot)
+
+    def render(self, values: Mapping[str, object]) -> str:
+        """Render the template; output is identical to `source.format(**values)`"""
+        parts = self.parts[:]
+        for index, field, conversion, format_spec in self.slots:
+            value = values[field]
+            if conversion:
+                value = _formatter.convert_field(value, conversion)
+            if format_spec or type(value) is not str:
+                value = format(value, format_spec)
+            parts[index] = value
+        return "".join(parts)
+
+    def bind(self, values: Mapping[str, object]) -> "CompiledTemplate":
+        """A template with the slots for `values` filled in and merged into the literal text.
+
+        Rendering the result with the remaining fields gives the same text as
+        rendering this template with all of them, so text that doesn't depend
+        on the remaining fields is formatted once rather than on every render.
+        """
+        slots = {index: (field, conversion, format_spec) for index, field, conversion, format_spec in self.slots}
+        source = []
+        for index, part in enumerate(self.parts):
+            if index not in slots:
+                source.append(_escape(part))
+                continue
+            field, conversion, format_spec = slots[index]
+            if field in values:
+                source.append(_escape(_formatter.format_field(
+                    _formatter.convert_field(values[field], conversion or None), format_spec)))
+            else:
+                conversion = f"!{conversion}" if conversion else ""
+                format_spec = f":{format_spec}" if format_spec else ""
+                source.append("{" + field + conversion + format_spec + "}")
+        return CompiledTemplate("".join(source))
+
+
+class LiveRender:
+    """A rendering kept as one string per segment, re-rendering only the slots of changed fields.
+
+    Joining `segments` gives the full text. `update` returns (index, text) for
+    each segment whose text changed, so a client holding the segments can
+    patch its copy instead of receiving the whole prompt again.
+    """
+
+    __slots__ = ("template", "segments")
+
+    def __init__(self, template: CompiledTemplate, values: Mapping[str, object]):
+        self.template = template
+        self.segments: List[str] = [part for part in template.parts]
+        for index, field, conversion, format_spec in template.slots:
+            self.segments[index] = _format_value(values[field], conversion, format_spec)
+
+    @property
+    def text(self) -> str:
+        return "".join(self.segments)
+
+    def update(self, values: Mapping[str, object], fields) -> List[Tuple[int, str]]:
+        """Re-render the slots of `fields` from `values`; returns the segments that changed, in order"""
+        patch = []
+        for field in fields:
+            for index, _, conversion, format_spec in self.template.field_slots.get(field, ()):
+                text = _format_value(values[field], conversion, format_spec)
+                if text != self.segments[index]:
+                    self.segments[index] = text
+                    patch.append((index, text))
+        patch.sort()
+        return patch
+
+
+def _format_value(value: object, conversion: str, format_spec: str) -> str:
+    """One slot's text, formatted exactly as `CompiledTemplate.render` formats it"""
+    if conversion:
+        value = _formatter.convert_field(value, conversion)
+    if format_spec or type(value) is not str:
+        value = format(value, format_spec)
+    return value
+
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def split_sections(source: str, headings: Tuple[str, ...]) -> List[Tuple[str, str]]:
+    """Split a template at lines consisting of one of `headings` followed by a colon.
+
+    Returns (heading, source) pairs whose sources concatenate back to the
+    original, so rendering the pieces in order gives the same text as
+    rendering the whole template. Text before the first heading is "Preamble".
+    """
+    pattern = re.compile(r'^(' + '|'.join(re.escape(heading) for heading in headings) + r'):$', re.MULTILINE)
+    sections = []
+    name, start = "Preamble", 0
+    for match in pattern.finditer(source):
+        if match.start() > start:
+            sections.append((name, source[start:match.start()]))
+        name, start = match.group(1), match.start()
+    sections.append((name, source[start:]))
+    return sections
+
+
+def template_version(source: str) -> str:
+    """Content hash identifying a template's exact source"""
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+
+class TemplateRegistry:
+    """Templates by content version, plus the current version for each mode.
+
+    Templates are compiled the first time they are rendered; `prewarm`
+    compiles them all up front instead.
+    """
+
+    def __init__(self, templates: Mapping[str, str] = None):
+        self.current: Dict[str, str] = {}
+        self._versions: Dict[str, Tuple[str, str]] = {}
+        self._compiled: Dict[str, CompiledTemplate] = {}
+        self._sections: Dict[Tuple[str, Tuple[str, ...]], List[Tuple[str, CompiledTemplate]]] = {}
+        for mode, source in (templates or {}).items():
+            self.add(mode, source, current=True)
+
+    def add(self, mode: str, source: str, current: bool = False) -> str:
+        version = template_version(source)
+        if version not in self._versions:
+            self._versions[version] = (mode, source)
+        if current:
+            self.current[mode] = version
+        return version
+
+    def prewarm(self, section_headings: Tuple[Tuple[str, ...], ...] = ()) -> None:
+        """Compile every known version, and its sections for each of `section_headings`"""
+        for version in self._versions:
+            self.get(version)
+            for headings in section_headings:
+                self.sections(version, headings)
+
+    def __contains__(self, version: str) -> bool:
+        return version in self._versions
+
+    def get(self, version: str) -> Optional[CompiledTemplate]:
+        template = self._compiled.get(version)
+        if template is None:
+            entry = self._versions.get(version)
+            if entry is None:
+                return None
+            template = self._compiled[version] = CompiledTemplate(entry[1])
+        return template
+
+    def sections(self, version: str, headings: Tuple[str, ...]) -> List[Tuple[str, CompiledTemplate]]:
+        """A version split into separately compiled sections (see split_sections), built once"""
+        key = (version, headings)
+        if key not in self._sections:
+            source = self._versions[version][1]
+            self._sections[key] = [(name, CompiledTemplate(part)) for name, part in split_sections(source, headings)]
+        return self._sections[key]
+
+    def current_template(self, mode: str) -> Optional[CompiledTemplate]:
+        version = self.current.get(mode)
+        return self.get(version) if version else None
+
+    def versions(self, mode: Optional[str] = None) -> Iterator[Tuple[str, str, CompiledTemplate]]:
+        """(version, mode, template) for every known version, current versions first"""
+        current = set(self.current.values())
+        for version, (template_mode, _) in sorted(self._versions.items(), key=lambda item: item[0] not in current):
+            if mode is None or template_mode == mode:
+                yield version, template_mode, self.get(version)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Recount the daily usage counters (usage_daily) from stored prompt history.
+
+Streams every prompt from before today, hot and archived, newest first, and
+recounts one day at a time. Once a day is counted, each of its counters is
+moved to the recounted value with one increment by the difference, so the
+counters are never cleared: /api/analytics/usage keeps serving whole numbers
+while the rebuild runs, and increments from the API still land. Today's
+counters are left to the API, which is still adding to them. Use it to
+backfill the counters for history from before they existed, or to repair
+them after a failed update.
+
+    python rebuild_usage.py [--batch-size 1000] [--dry-run]
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
+
+import server
+from storage import Increment, Query
+from usage import day_start, usage_increments
+
+# Everything usage_increments reads from a prompt document
+FIELDS = ['id', 'timestamp', 'mode', 'request_data']
+
+
+async def rebuild(batch_size: int, dry_run: bool) -> dict:
+    await server.storage.ensure_indexes()
+    today = day_start(datetime.now(timezone.utc))
+    counts = {'prompts': 0, 'days': 0, 'updates': 0}
+    # Recounted counters by day, for days the stream may not be done with yet
+    pending: Dict[datetime, Dict[str, Increment]] = {}
+    recounted = set()
+
+    async def replace_days(after: Optional[datetime] = None) -> None:
+        """Write out every pending day later than `after`, or all of them"""
+        for day in sorted(pending, reverse=True):
+            if after is not None and day <= after:
+                break
+            counts['updates'] += await replace_day(day, pending.pop(day).values(), dry_run)
+            counts['days'] += 1
+            recounted.add(day)
+
+    batch = []
+    async for document in server.stream_prompts(Query(until=today), FIELDS, batch_size):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            add_counts(pending, batch)
+            counts['prompts'] += len(batch)
+            # Newest first, so every day after this batch's last one is complete
+            await replace_days(after=day_start(batch[-1]['timestamp']))
+            batch = []
+            print(f"  {counts['prompts']} prompts counted")
+    add_counts(pending, batch)
+    counts['prompts'] += len(batch)
+    await replace_days()
+
+    # Counters for days that no longer have any prompts go to zero
+    stale = set()
+    async for counter in server.storage.stream('usage_daily', Query(until=today), ['timestamp']):
+        day = day_start(counter['timestamp'])
+        if day not in recounted:
+            stale.add(day)
+    for day in stale:
+        counts['updates'] += await replace_day(day, (), dry_run)
+    return counts
+
+
+def add_counts(pending: Dict[datetime, Dict[str, Increment]], documents) -> None:
+    for update in usage_increments(documents):
+        day = pending.setdefault(update.on_insert['timestamp'], {})
+        if update.id in day:
+            day[update.id].inc['count'] += update.inc['count']
+        else:
+            day[update.id] = update
+
+
+async def replace_day(day: datetime, recount: Iterable[Increment], dry_run: bool) -> int:
+    """Move the day's stored counters to the recounted values; returns how many changed"""
+    query = Query(since=day, until=day + timedelta(days=1))
+    stored = {counter['id']: counter.get('count', 0) async for counter in server.storage.stream('usage_daily', query)}
+    updates = []
+    for update in recount:
+        difference = update.inc['count'] - stored.pop(update.id, 0)
+        if difference:
+            updates.append(Increment(id=update.id, on_insert=update.on_insert, inc={'count': difference}))
+    # Counters with nothing left to count
+    updates += [Increment(id=id, inc={'count': -count}) for id, count in stored.items() if count]
+    if updates and not dry_run:
+        await server.storage.increment('usage_daily', updates)
+    return len(updates)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help='count without touching the stored counters')
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            return await rebuild(args.batch_size, args.dry_run)
+        finally:
+            await server.storage.close()
+
+    counts = asyncio.run(run())
+    prefix = "Would correct" if args.dry_run else "Corrected"
+    print(f"{prefix} {counts['updates']} usage counters over {counts['days']} days from {counts['prompts']} prompts")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Render a CSV or NDJSON file of briefs to prompts offline, without the API or a database.
+
+Rows are read in chunks and rendered by a pool of worker processes with the
+same MASTER_PROMPTS templates and generate_prompt the API uses; output keeps
+the input order. Each output record has the input row number, mode, template
+version and generated prompt. Rows that fail validation are counted, and
+written to --errors if given.
+
+    python render_briefs.py briefs.csv prompts.ndjson [--workers 8] [--chunk-size 1000]
+    python render_briefs.py briefs.ndjson prompts.parquet --output-format parquet
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import orjson
+import typer
+
+from jobs import FORMATS, detect_format, next_chunk, read_rows
+
+OUTPUT_FORMATS = ('ndjson', 'parquet')
+
+# (records, [(row number, error)]) for one chunk; records are NDJSON bytes or a list of dicts
+ChunkResult = Tuple[object, List[Tuple[int, str]]]
+
+
+def init_worker() -> None:
+    import server
+
+    # Every brief in a file is rendered once; caching renders would only cost memory
+    server.render_cache.max_entries = 0
+    server.TEMPLATES.prewarm()
+
+
+def render_chunk(rows: list, encode: bool) -> ChunkResult:
+    """Validate and render one chunk of rows; with `encode`, records come back as NDJSON bytes"""
+    import server
+    from fastapi import HTTPException
+    from pydantic import ValidationError
+
+    records = []
+    errors = []
+    for number, row, error in rows:
+        if error is not None:
+            errors.append((number, error))
+            continue
+        try:
+            request = server.PromptRequest.model_validate(row)
+            prompt = server.generate_prompt(request)
+        except ValidationError as e:
+            errors.append((number, server.batch_error(e)))
+            continue
+        except HTTPException as e:
+            errors.append((number, e.detail))
+            continue
+        records.append({
+            'row': number,
+            'mode': request.mode,
+            'template_version': server.TEMPLATES.current[request.mode],
+            'generated_prompt': prompt,
+        })
+    if encode:
+        return b''.join(orjson.dumps(record) + b'\n' for record in records), errors
+    return records, errors
+
+
+def chunks(path: Path, format: str, size: int) -> Iterator[list]:
+    with open(path, 'rb') as file:
+        rows = read_rows(file, format)
+        while True:
+            chunk = next_chunk(rows, size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def render_all(path: Path, format: str, chunk_size: int, workers: int, encode: bool) -> Iterator[ChunkResult]:
+    """Results for every chunk, in input order, with at most 2 chunks per worker in flight"""
+    if workers <= 1:
+        init_worker()
+        for chunk in chunks(path, format, chunk_size):
+            yield render_chunk(chunk, encode)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        pending = deque()
+        for chunk in chunks(path, format, chunk_size):
+            pending.append(pool.submit(render_chunk, chunk, encode))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class NDJSONWriter:
+    def __init__(self, path: Path):
+        self.file = open(path, 'wb')
+
+    def write(self, records: bytes) -> None:
+        self.file.write(records)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetWriter:
+    """One row group per chunk, so memory stays bounded by the chunk size"""
+
+    def __init__(self, path: Path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise typer.BadParameter("Parquet output needs pyarrow (pip install pyarrow)", param_hint='--output-format')
+        self.pa = pa
+        self.schema = pa.schema([
+            ('row', pa.int64()),
+            ('mode', pa.string()),
+            ('template_version', pa.string()),
+            ('generated_prompt', pa.string()),
+        ])
+        self.writer = pq.ParquetWriter(str(path), self.schema, compression='zstd')
+
+    def write(self, records: List[dict]) -> None:
+        if records:
+            self.writer.write_table(self.pa.Table.from_pylist(records, schema=self.schema))
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def main(
+    input: Path = typer.Argument(..., exists=True, dir_okay=False, help="CSV or NDJSON file of briefs"),
+    output: Path = typer.Argument(..., dir_okay=False, help="Where to write the rendered prompts"),
+    format: Optional[str] = typer.Option(None, help=f"Input format ({', '.join(FORMATS)}); default from the extension"),
+    output_format: Optional[str] = typer.Option(
+        None, help=f"Output format ({', '.join(OUTPUT_FORMATS)}); default from the extension"),
+    workers: int = typer.Option(os.cpu_count() or 1, min=1, help="Worker processes; 1 renders in this process"),
+    chunk_size: int = typer.Option(1000, min=1, help="Rows per unit of work handed to a worker"),
+    errors: Optional[Path] = typer.Option(None, dir_okay=False, help="Write failed rows here as NDJSON"),
+) -> None:
+    format = detect_format(format, input.name, None)
+    if format is None:
+        raise typer.BadParameter(f"Use one of: {', '.join(FORMATS)}", param_hint='--format')
+    if output_format is None:
+        output_format = 'parquet' if output.suffix.lower() == '.parquet' else 'ndjson'
+    if output_format not in OUTPUT_FORMATS:
+        raise typer.BadParameter(f"Use one of: {', '.join(OUTPUT_FORMATS)}", param_hint='--output-format')
+
+    writer = ParquetWriter(output) if output_format == 'parquet' else NDJSONWriter(output)
+    error_file = open(errors, 'wb') if errors else None
+    rendered = failed = 0
+    start = last_report = time.perf_counter()
+    try:
+        for records, chunk_errors in render_all(input, format, chunk_size, workers, output_format == 'ndjson'):
+            writer.write(records)
+            rendered += records.count(b'\n') if output_format == 'ndjson' else len(records)
+            failed += len(chunk_errors)
+            if error_file is not None:
+                error_file.write(b''.join(orjson.dumps({'row': row, 'error': error}) + b'\n' for row, error in chunk_errors))
+            now = time.perf_counter()
+            if now - last_report >= 5:
+                last_report = now
+                typer.echo(f"  {rendered + failed:,} rows, {(rendered + failed) / (now - start):,.0f} rows/s", err=True)
+    finally:
+        writer.close()
+        if error_file is not None:
+            error_file.close()
+    elapsed = time.perf_counter() - start
+    typer.echo(
+        f"Rendered {rendered:,} prompts ({failed:,} rows failed) in {elapsed:.1f}s: "
+        f"{(rendered + failed) / elapsed:,.0f} rows/s with {workers} worker{'s' if workers != 1 else ''}",
+        err=True,
+    )
+    if failed and errors is None:
+        typer.echo("Pass --errors FILE to see which rows failed and why", err=True)
+
+
+if __name__ == '__main__':
+    typer.run(main)
@@ -0,0 +1,101 @@
+"""In-process LRU cache for rendered prompts.
+
+Entries are keyed by template version plus the normalized placeholder values, expire
+after a TTL, and are evicted least-recently-used first once either the entry
+limit or the memory ceiling is reached.
+"""
+import sys
+import time
+from collections import OrderedDict
+from typing import Hashable, Mapping, Optional, Tuple
+
+
+def render_key(version: str, values: Mapping[str, object]) -> Hashable:
+    """Cache key for a template version and its normalized placeholder values.
+
+    A plain tuple rather than a digest: hashing the tuple is cheaper than
+    rendering, while a cryptographic digest of the same fields costs more than
+    the render it is meant to skip. Callers must build `values` with a fixed
+    key order, as `prompt_values` does.
+    """
+    return (version, *values.items())
+
+
+def _entry_size(key: Hashable, value: str) -> int:
+    """Approximate bytes held by a cache entry (the key's field values plus the prompt)"""
+    size = sys.getsizeof(value)
+    if isinstance(key, tuple):
+        size += sum(sys.getsizeof(item[1]) for item in key if isinstance(item, tuple))
+    return size
+
+
+class RenderCache:
+    """Size-bounded LRU with TTL and hit/miss/eviction counters"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[float, str, int]]" = OrderedDict()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: str) -> None:
+        if not self.enabled:
+            return
+        size = _entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value, size)
+        self.bytes_used += size
+        while len(self._entries) > self.max_entries or self.bytes_used > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes_used = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes_used,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self.bytes_used -= size
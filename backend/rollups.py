@@ -0,0 +1,56 @@
+"""Time-bucketed rollups of status checks.
+
+Every status check bumps three counter documents: the client's all-time
+totals in `status_clients`, and its minute and hour buckets in
+`status_rollups`. Bucket ids are derived from (granularity, client, bucket
+start), so a summary reads a known set of ids instead of scanning history.
+"""
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from storage import Increment, utc_naive
+
+GRANULARITIES = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1)}
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    timestamp = utc_naive(timestamp)
+    if granularity == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_id(granularity: str, client_name: str, start: datetime) -> str:
+    return f"{granularity}:{start.isoformat(timespec='minutes')}:{client_name}"
+
+
+def recent_buckets(now: datetime, granularity: str, count: int) -> List[datetime]:
+    """Start times of the last `count` buckets, oldest first, ending with the one holding `now`"""
+    current = bucket_start(now, granularity)
+    step = GRANULARITIES[granularity]
+    return [current - step * offset for offset in range(count - 1, -1, -1)]
+
+
+def status_increments(client_name: str, timestamp: datetime) -> Tuple[Increment, List[Increment]]:
+    """Counter updates for one status check: (client totals, [minute bucket, hour bucket])"""
+    timestamp = utc_naive(timestamp)
+    client = Increment(
+        id=client_name,
+        # The client's row sorts by first check-in, which never changes
+        on_insert={'client_name': client_name, 'timestamp': timestamp},
+        inc={'count': 1},
+        min={'first_seen': timestamp},
+        max={'last_seen': timestamp},
+    )
+    buckets = []
+    for granularity in GRANULARITIES:
+        start = bucket_start(timestamp, granularity)
+        buckets.append(Increment(
+            id=bucket_id(granularity, client_name, start),
+            # Rollups expire by bucket start under the rollup TTL
+            on_insert={'client_name': client_name, 'granularity': granularity, 'timestamp': start},
+            inc={'count': 1},
+            min={'first_seen': timestamp},
+            max={'last_seen': timestamp},
+        ))
+    return client, buckets
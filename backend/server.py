@@ -1,28 +1,189 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Body, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+import asyncio
+import itertools
 import os
 import logging
+import tempfile
+import time
+import zlib
+import orjson
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, Dict, List, Optional
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+
+from admission import AdmissionMiddleware, ConcurrencyLimiter, TokenBuckets
+from conditional import ChangeMarker, is_not_modified
+from jobs import Job, JobRegistry, UploadError, UploadTooLarge, detect_format, next_chunk, read_rows, receive_upload, remove_file
+from metrics import SIZE_BUCKETS, InstrumentedStorage, MetricsMiddleware, Registry
+from pagination import decode_cursor, decode_offset_cursor, encode_offset_cursor, next_cursor
+from prompt_engine import LiveRender, TemplateRegistry
+from render_cache import RenderCache, render_key
+from rollups import bucket_id, recent_buckets, status_increments
+from storage import InsertErrors, Query as StorageQuery, storage_from_env
+from timing import SlowRequestLog, TimedRoute, TimingMiddleware, add_stage, annotate, stage
+from usage import DIMENSIONS as USAGE_DIMENSIONS, day_start, recent_days, usage_increments
+from write_behind import WriteBehindFull, WriteBehindQueue
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Metrics exposed at /api/metrics in Prometheus text format
+metrics = Registry()
+HTTP_REQUESTS = metrics.counter(
+    'bizbuddy_http_requests_total', 'HTTP requests by method, route and status', ('method', 'route', 'status'))
+HTTP_LATENCY = metrics.histogram(
+    'bizbuddy_http_request_duration_seconds', 'HTTP request latency', ('method', 'route', 'status'))
+HTTP_IN_FLIGHT = metrics.gauge('bizbuddy_http_requests_in_flight', 'HTTP requests currently being served')
+RENDER_LATENCY = metrics.histogram(
+    'bizbuddy_prompt_render_seconds', 'Time to produce a prompt in generate_prompt, cache lookups included', ('mode',))
+RENDER_SIZE = metrics.histogram(
+    'bizbuddy_prompt_size_chars', 'Length of generated prompts', ('mode',), buckets=SIZE_BUCKETS)
+STORAGE_LATENCY = metrics.histogram(
+    'bizbuddy_storage_operation_seconds', 'Storage call latency', ('backend', 'operation', 'collection'))
+ARCHIVED_PROMPTS = metrics.counter(
+    'bizbuddy_archived_prompts_total', 'Prompt documents moved from the hot collection to the archive')
+ADMISSION_OUTCOMES = metrics.counter(
+    'bizbuddy_admission_requests_total',
+    'Generation requests by admission outcome (admitted, queued, rate_limited, queue_full, queue_timeout)',
+    ('outcome',))
+
+# Per-request stage timing (see timing.py): a REQUEST_TIMING_SAMPLE_RATE fraction of requests
+# get a Server-Timing header, and the slowest SLOW_REQUEST_LOG_SIZE of them are kept for
+# GET /api/debug/slow. A timed request costs about 60 µs, so the default samples 1%;
+# 1 times every request, 0 turns timing off
+REQUEST_TIMING_SAMPLE_RATE = float(os.environ.get('REQUEST_TIMING_SAMPLE_RATE', '0.01'))
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', 'true').lower() in ('1', 'true', 'yes')
+slow_requests = SlowRequestLog(capacity=int(os.environ.get('SLOW_REQUEST_LOG_SIZE', '50')))
+
+# Storage backend (MongoDB by default; STORAGE_BACKEND=sqlite or memory for single-node runs)
+storage = InstrumentedStorage(storage_from_env(), STORAGE_LATENCY)
+
+# Rendered prompt cache, off by default: a compiled render is about as fast as a cache
+# hit, and on unique briefs every lookup is a miss on top of the render
+# (benchmarks/render_bench.py). Set RENDER_CACHE_MAX_ENTRIES to enable it.
+render_cache = RenderCache(
+    max_entries=int(os.environ.get('RENDER_CACHE_MAX_ENTRIES', '0')),
+    ttl_seconds=float(os.environ.get('RENDER_CACHE_TTL_SECONDS', '300')),
+    max_bytes=int(os.environ.get('RENDER_CACHE_MAX_BYTES', str(16 * 1024 * 1024))),
+)
+
+# Upper bound on briefs accepted by /api/generate-prompts/batch
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '100'))
+
+# Upper bound on combinations /api/generate-prompts/matrix will expand
+MAX_MATRIX_SIZE = int(os.environ.get('MAX_MATRIX_SIZE', '1000'))
+
+# Admission control for /api/generate-* (see admission.py). Per-client token buckets are
+# off unless RATE_LIMIT_PER_SECOND is set; clients are keyed by RATE_LIMIT_KEY_HEADER when
+# the request carries it, else by peer IP. MAX_IN_FLIGHT=0 removes the concurrency cap.
+rate_limits = TokenBuckets(
+    rate=float(os.environ.get('RATE_LIMIT_PER_SECOND', '0')),
+    burst=float(os.environ.get('RATE_LIMIT_BURST', '20')),
+    max_keys=int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', '10000')),
+)
+concurrency_limit = ConcurrencyLimiter(
+    limit=int(os.environ.get('MAX_IN_FLIGHT', '64')),
+    max_queue=int(os.environ.get('MAX_QUEUED', '128')),
+    timeout=float(os.environ.get('QUEUE_TIMEOUT_MS', '250')) / 1000,
+)
+RATE_LIMIT_KEY_HEADER = os.environ.get('RATE_LIMIT_KEY_HEADER') or None
+
+# Bumped after every successful insert; lets the list endpoints answer conditional GETs from memory
+CHANGE_MARKERS = {'prompts': ChangeMarker(), 'status_checks': ChangeMarker()}
+
+# Optional write-behind persistence: generated prompts are queued and bulk-inserted
+# in the background instead of awaiting insert_one on the request path
+WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+async def flush_prompts(documents: List[dict]) -> int:
+    """Write-behind flush; returns how many documents the insert rejected"""
+    errors = await storage.insert_many('prompts', documents)
+    await prompts_stored(documents, errors)
+    for index, error in errors:
+        logger.error("Write-behind insert of prompt %s failed: %s", documents[index].get('id'), error)
+    return len(errors)
+
+write_behind = WriteBehindQueue(
+    flush_prompts,
+    max_size=int(os.environ.get('WRITE_BEHIND_MAX_QUEUE', '10000')),
+    flush_size=int(os.environ.get('WRITE_BEHIND_FLUSH_SIZE', '500')),
+    flush_interval=float(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL_MS', '50')) / 1000,
+    put_timeout=float(os.environ.get('WRITE_BEHIND_PUT_TIMEOUT_MS', '1000')) / 1000,
+    retry_backoff=float(os.environ.get('WRITE_BEHIND_RETRY_BACKOFF_MS', '100')) / 1000,
+    max_retry_backoff=float(os.environ.get('WRITE_BEHIND_MAX_RETRY_BACKOFF_MS', '5000')) / 1000,
+    close_retries=int(os.environ.get('WRITE_BEHIND_CLOSE_RETRIES', '3')),
+)
+
+# Sections /api/generate-prompt/stream sends as separate events, in template order
+STREAM_SECTIONS = ("Role", "Objective", "Context", "Instructions", "Notes")
+
+# Fire-and-forget tasks (e.g. persistence behind a streamed response); held so they aren't garbage collected
+background_tasks = set()
+
+# Fields GET /api/prompts/export can project; generated_prompt is re-rendered from the inputs when needed
+EXPORT_FIELDS = ('id', 'mode', 'timestamp', 'generated_prompt', 'template_version', 'request_data')
+
+# Fields /api/prompts/search matches, with relevance weights. generated_prompt is only
+# stored on legacy documents; for the rest, the brief fields are the non-boilerplate text
+SEARCH_FIELDS = {
+    'request_data.product': 10,
+    'request_data.offer': 5,
+    'request_data.audience': 5,
+    'request_data.brand_voice': 2,
+    'generated_prompt': 1,
+}
+
+# Deepest result /api/prompts/search pages to; relevance order can't be keyset-paginated
+MAX_SEARCH_RESULTS = int(os.environ.get('MAX_SEARCH_RESULTS', '1000'))
+
+# Bulk uploads (POST /api/prompts/upload) are streamed to UPLOAD_DIR, then stored
+# JOB_CHUNK_SIZE rows per bulk insert by at most MAX_CONCURRENT_JOBS background jobs
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR') or tempfile.gettempdir()
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(200 * 1024 * 1024)))
+JOB_CHUNK_SIZE = int(os.environ.get('JOB_CHUNK_SIZE', '500'))
+jobs = JobRegistry(max_finished=int(os.environ.get('JOB_HISTORY', '100')))
+job_slots = asyncio.Semaphore(int(os.environ.get('MAX_CONCURRENT_JOBS', '2')))
+# Running and queued upload jobs; unlike background_tasks, shutdown cancels them instead of waiting
+job_tasks = set()
+
+# Largest page the list endpoints will return
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '1000'))
+
+# Raw status checks expire after STATUS_TTL_SECONDS and minute/hour rollups after
+# STATUS_ROLLUP_TTL_SECONDS; per-client totals are kept. 0 disables expiry
+STATUS_TTL_SECONDS = float(os.environ.get('STATUS_TTL_SECONDS', str(7 * 24 * 3600)))
+STATUS_ROLLUP_TTL_SECONDS = float(os.environ.get('STATUS_ROLLUP_TTL_SECONDS', str(90 * 24 * 3600)))
+
+# Prompts older than PROMPT_ARCHIVE_AFTER_DAYS are moved, ARCHIVE_BATCH_SIZE at a time, from the
+# hot prompts collection to ARCHIVE_COLLECTION every ARCHIVE_INTERVAL_SECONDS, so the hot
+# collection and its indexes stay sized to recent history. History and export read on into the
+# archive once the hot collection runs out. 0 disables archiving
+ARCHIVE_COLLECTION = 'prompts_archive'
+PROMPT_ARCHIVE_AFTER_DAYS = float(os.environ.get('PROMPT_ARCHIVE_AFTER_DAYS', '0'))
+ARCHIVE_INTERVAL_SECONDS = float(os.environ.get('ARCHIVE_INTERVAL_SECONDS', '3600'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '1000'))
+
+# How often backends without native TTL indexes (memory, sqlite) delete expired documents. On
+# MongoDB, whose TTL monitor deletes unseen, it is how often the status list's ETag is renewed
+TTL_PURGE_INTERVAL_SECONDS = float(os.environ.get('TTL_PURGE_INTERVAL_SECONDS', '60'))
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson rendering with UTC datetimes as "Z", matching what Pydantic emits"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TimedRoute)
 
 # Define Models
 class PromptRequest(BaseModel):
@@ -52,6 +213,40 @@ class PromptResponse(BaseModel):
     generated_prompt: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class BatchItemResult(BaseModel):
+    index: int
+    ok: bool
+    result: Optional[PromptResponse] = None
+    error: Optional[str] = None
+
+class BatchPromptResponse(BaseModel):
+    results: List[BatchItemResult]
+    succeeded: int
+    failed: int
+
+class PromptMatrixRequest(BaseModel):
+    base: PromptRequest
+    # Field name -> values to substitute; every combination is generated
+    vary: Dict[str, List[Any]]
+
+class MatrixItemResult(BaseModel):
+    values: Dict[str, Any]
+    ok: bool
+    result: Optional[PromptResponse] = None
+    error: Optional[str] = None
+
+class MatrixPromptResponse(BaseModel):
+    results: List[MatrixItemResult]
+    succeeded: int
+    failed: int
+
+class PromptSearchResult(PromptResponse):
+    score: float
+
+class PromptSearchPage(BaseModel):
+    items: List[PromptSearchResult]
+    next_cursor: Optional[str] = None
+
 class StatusCheck(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     client_name: str
@@ -60,6 +255,45 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+class PromptPage(BaseModel):
+    items: List[PromptResponse]
+    next_cursor: Optional[str] = None
+
+class StatusCheckPage(BaseModel):
+    items: List[StatusCheck]
+    next_cursor: Optional[str] = None
+
+class ClientStatusSummary(BaseModel):
+    client_name: str
+    count: int
+    first_seen: datetime
+    last_seen: datetime
+    # Check-ins per bucket, aligned with StatusSummary.bucket_starts
+    counts: List[int]
+
+class UsageSeries(BaseModel):
+    value: str
+    total: int
+    counts: List[int]  # per day, aligned with day_starts
+
+class UsageOther(BaseModel):
+    values: int  # distinct values beyond `limit`, folded together
+    total: int
+    counts: List[int]
+
+class UsageReport(BaseModel):
+    dimension: str
+    day_starts: List[datetime]
+    values: List[UsageSeries]
+    other: Optional[UsageOther] = None
+    total: int
+
+class StatusSummary(BaseModel):
+    granularity: str
+    bucket_starts: List[datetime]
+    clients: List[ClientStatusSummary]
+    next_cursor: Optional[str] = None
+
 # Backend Master Prompt Templates - Using Provided Templates for Direct Output
 MASTER_PROMPTS = {
     "short_ad_copy": """Role:
@@ -261,34 +495,339 @@ Note 2: Before generating, confirm inputs (brand values, audience resonance, leg
 Note 3: Require at least 3 radically different creative angles (not just wordplay variations). Encourage risk-taking in phrasing while keeping compliance guardrails intact."""
 }
 
+# Each template is parsed once, on first use or at startup when PREWARM_TEMPLATES is set;
+# generate_prompt only joins the precompiled segments.
+# Versions superseded by edits above stay readable through the prompt_templates collection.
+TEMPLATES = TemplateRegistry(MASTER_PROMPTS)
+PREWARM_TEMPLATES = os.environ.get('PREWARM_TEMPLATES', 'true').lower() in ('1', 'true', 'yes')
+
+def prompt_values(request: PromptRequest) -> dict:
+    """Placeholder values for a request, with defaults applied for empty fields"""
+    return {
+        "product": request.product,
+        "offer": request.offer,
+        "audience": request.audience,
+        "brand_voice": request.brand_voice,
+        "market": request.market,
+        "language": request.language,
+        "channel": request.channel,
+        "objective": request.objective,
+        "constraints": request.constraints or "None specified",
+        "competitive_angle": request.competitive_angle or "Not specified",
+        "references": request.references or "None provided",
+        "asset_type": request.asset_type or "image",
+        "video_len": request.video_len or 30,
+        "overlay_char_limit": request.overlay_char_limit or 18,
+        "funnel_stage": request.funnel_stage or "conversion",
+        "reading_level": request.reading_level or "Grade 7",
+    }
+
 def generate_prompt(request: PromptRequest) -> str:
     """Generate the final prompt based on the mode and user inputs"""
-    template = MASTER_PROMPTS.get(request.mode)
-    if not template:
+    version = TEMPLATES.current.get(request.mode)
+    if not version:
         raise HTTPException(status_code=400, detail=f"Invalid mode: {request.mode}")
-    
-    # Fill in the template with user data
-    prompt = template.format(
-        product=request.product,
-        offer=request.offer,
-        audience=request.audience,
-        brand_voice=request.brand_voice,
-        market=request.market,
-        language=request.language,
-        channel=request.channel,
-        objective=request.objective,
-        constraints=request.constraints or "None specified",
-        competitive_angle=request.competitive_angle or "Not specified",
-        references=request.references or "None provided",
-        asset_type=request.asset_type or "image",
-        video_len=request.video_len or 30,
-        overlay_char_limit=request.overlay_char_limit or 18,
-        funnel_stage=request.funnel_stage or "conversion",
-        reading_level=request.reading_level or "Grade 7"
-    )
-    
+    start = time.perf_counter()
+    prompt = render_version(version, request)
+    elapsed = time.perf_counter() - start
+    RENDER_LATENCY.observe(elapsed, request.mode)
+    add_stage('render', elapsed)
+    annotate(mode=request.mode)
+    RENDER_SIZE.observe(len(prompt), request.mode)
+    return prompt
+
+def render_version(version: str, request: PromptRequest) -> str:
+    """Render a specific template version, reusing an earlier render of the same brief"""
+    template = TEMPLATES.get(version)
+    values = prompt_values(request)
+    if not render_cache.enabled:
+        return template.render(values)
+    key = render_key(version, values)
+    prompt = render_cache.get(key)
+    if prompt is None:
+        prompt = template.render(values)
+        render_cache.put(key, prompt)
     return prompt
 
+def prompt_document(prompt_response: PromptResponse, request: PromptRequest) -> dict:
+    """The document stored in the prompts collection for a generated prompt.
+
+    Only the inputs and the template version are stored; the prompt text is
+    re-rendered on read by hydrate_prompt.
+    """
+    prompt_dict = prompt_response.model_dump(exclude={'generated_prompt'})
+    prompt_dict['template_version'] = TEMPLATES.current[request.mode]
+    prompt_dict['request_data'] = request.model_dump()
+    return prompt_dict
+
+def hydrate_prompt(document: dict) -> dict:
+    """Fill in generated_prompt for a stored document; legacy documents already carry it"""
+    if 'generated_prompt' not in document:
+        version = document['template_version']
+        if version not in TEMPLATES:
+            raise HTTPException(status_code=500, detail=f"Unknown template version: {version}")
+        # Stored inputs were validated when they were written; skip validating them again
+        request = PromptRequest.model_construct(**document['request_data'])
+        # Rendered directly: a page of history would only churn the render cache
+        document['generated_prompt'] = TEMPLATES.get(version).render(prompt_values(request))
+    return document
+
+def prompt_item(document: dict) -> dict:
+    """PromptResponse fields of a hydrated document, without building the model"""
+    return {
+        'id': document['id'],
+        'mode': document['mode'],
+        'generated_prompt': document['generated_prompt'],
+        'timestamp': document['timestamp'],
+    }
+
+async def load_template_versions(documents: List[dict]) -> None:
+    """Load superseded template versions referenced by `documents` from the prompt_templates collection"""
+    missing = {
+        doc['template_version'] for doc in documents
+        if 'generated_prompt' not in doc and doc['template_version'] not in TEMPLATES
+    }
+    if missing:
+        for template in await storage.find_in('prompt_templates', list(missing)):
+            TEMPLATES.add(template['mode'], template['source'])
+
+async def register_template_versions() -> None:
+    """Record every current template in prompt_templates so its version stays renderable after edits"""
+    await asyncio.gather(*(
+        storage.insert_if_absent('prompt_templates', {
+            'id': TEMPLATES.current[mode],
+            'mode': mode,
+            'source': source,
+            'timestamp': datetime.now(timezone.utc),
+        })
+        for mode, source in MASTER_PROMPTS.items()
+    ))
+
+async def save_prompt(document: dict) -> None:
+    """Persist a prompt document, through the write-behind queue when it is enabled"""
+    if WRITE_BEHIND_ENABLED:
+        await write_behind.put(document)
+    else:
+        await storage.insert('prompts', document)
+        await prompts_stored([document])
+
+async def prompts_stored(documents: List[dict], errors: InsertErrors = ()) -> None:
+    """Bookkeeping once prompt documents are written: the list change marker and the usage counters"""
+    failed = {index for index, _ in errors}
+    stored = [document for index, document in enumerate(documents) if index not in failed]
+    if not stored:
+        return
+    CHANGE_MARKERS['prompts'].touch()
+    # One atomic upsert per (day, dimension, value); a failure leaves the prompts stored
+    # and is logged, and rebuild_usage.py recounts from history
+    try:
+        await storage.increment('usage_daily', usage_increments(stored))
+    except Exception:
+        logger.exception("Failed to update usage counters")
+
+def page_query(cursor: Optional[str], since: Optional[datetime], until: Optional[datetime], **equals) -> StorageQuery:
+    """Storage query for a keyset page; a malformed cursor is the client's error"""
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StorageQuery(
+        equals={field: value for field, value in equals.items() if value is not None},
+        since=since,
+        until=until,
+        after=after,
+    )
+
+async def find_prompt_page(query: StorageQuery, limit: int) -> List[dict]:
+    """Up to `limit` prompts, newest first, continuing into the archive once the hot collection runs out
+
+    Archived documents are all older than the hot ones, so the archive is only
+    read for the tail of the history.
+    """
+    prompts = await storage.find_page('prompts', query, limit)
+    if len(prompts) < limit:
+        after = (prompts[-1]['timestamp'], prompts[-1]['id']) if prompts else query.after
+        archived = StorageQuery(query.equals, query.since, query.until, after)
+        prompts += await storage.find_page(ARCHIVE_COLLECTION, archived, limit - len(prompts))
+    return prompts
+
+async def stream_prompts(query: StorageQuery, fields: List[str], batch_size: int):
+    """Every matching prompt, newest first: the hot collection, then the archive"""
+    last = None
+    async for document in storage.stream('prompts', query, fields + ['timestamp', 'id'], batch_size):
+        last = document
+        yield document
+    after = (last['timestamp'], last['id']) if last is not None else query.after
+    archived = StorageQuery(query.equals, query.since, query.until, after)
+    async for document in storage.stream(ARCHIVE_COLLECTION, archived, fields, batch_size):
+        yield document
+
+async def archive_prompts() -> int:
+    """Move prompts past PROMPT_ARCHIVE_AFTER_DAYS to the archive, oldest first; returns how many"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=PROMPT_ARCHIVE_AFTER_DAYS)
+    total = 0
+    while True:
+        moved = await storage.move_before('prompts', ARCHIVE_COLLECTION, cutoff, ARCHIVE_BATCH_SIZE)
+        total += moved
+        ARCHIVED_PROMPTS.inc(amount=moved)
+        if moved < ARCHIVE_BATCH_SIZE:
+            return total
+        # Let request handlers in between batches
+        await asyncio.sleep(0)
+
+def run_in_background(coroutine, tasks: set = background_tasks) -> None:
+    """Schedule a coroutine without awaiting it, held in `tasks`; failures are logged"""
+    task = asyncio.create_task(coroutine)
+    tasks.add(task)
+
+    def done(task):
+        tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Background task failed", exc_info=task.exception())
+    task.add_done_callback(done)
+
+def stream_event(format: str, event: str, data: dict) -> bytes:
+    """One event of /api/generate-prompt/stream as an NDJSON line or an SSE message"""
+    if format == "sse":
+        return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data, option=orjson.OPT_UTC_Z) + b"\n\n"
+    return orjson.dumps({"event": event, **data}, option=orjson.OPT_UTC_Z) + b"\n"
+
+async def ndjson_chunks(documents, fields: List[str], batch_size: int):
+    """Encode a stream of prompt documents as NDJSON, one chunk per batch_size documents"""
+    batch = []
+    async for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield await encode_export_batch(batch, fields)
+            batch = []
+    if batch:
+        yield await encode_export_batch(batch, fields)
+
+async def encode_export_batch(documents: List[dict], fields: List[str]) -> bytes:
+    if 'generated_prompt' in fields:
+        await load_template_versions(documents)
+        documents = [hydrate_prompt(document) for document in documents]
+    lines = [
+        orjson.dumps({field: document[field] for field in fields if field in document}, option=orjson.OPT_UTC_Z)
+        for document in documents
+    ]
+    lines.append(b'')
+    return b'\n'.join(lines)
+
+async def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+async def process_upload(job: Job) -> None:
+    """Validate and store every row of an uploaded file, JOB_CHUNK_SIZE rows per bulk insert"""
+    try:
+        async with job_slots:
+            job.start()
+            loop = asyncio.get_running_loop()
+            try:
+                with open(job.path, 'rb') as file:
+                    rows = read_rows(file, job.format)
+                    while True:
+                        # Reading and parsing the file happen off the event loop
+                        chunk = await loop.run_in_executor(None, next_chunk, rows, JOB_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        job.bytes_read = file.tell()
+                        await store_upload_chunk(job, chunk)
+            except Exception as e:
+                logger.exception("Upload job %s failed", job.id)
+                job.finish(str(e))
+            else:
+                job.finish()
+    except asyncio.CancelledError:
+        # Shutdown; rows stored so far stay stored
+        job.finish(f"Interrupted by server shutdown after {job.rows_read} rows")
+        raise
+    finally:
+        remove_file(job.path)
+
+async def store_upload_chunk(job: Job, chunk) -> None:
+    documents = []
+    numbers = []
+    for number, row, error in chunk:
+        job.rows_read += 1
+        if error is not None:
+            job.record_error(number, error)
+            continue
+        try:
+            request = PromptRequest.model_validate(row)
+        except ValidationError as e:
+            job.record_error(number, batch_error(e))
+            continue
+        if request.mode not in TEMPLATES.current:
+            job.record_error(number, f"Invalid mode: {request.mode}")
+            continue
+        # Documents hold only the inputs and template version, so the text is rendered when read
+        prompt_response = PromptResponse(mode=request.mode, generated_prompt="")
+        documents.append(prompt_document(prompt_response, request))
+        numbers.append(number)
+    if not documents:
+        return
+    errors = await storage.insert_many('prompts', documents)
+    await prompts_stored(documents, errors)
+    job.succeeded += len(documents) - len(errors)
+    for index, error in errors:
+        job.record_error(numbers[index], error)
+
+def batch_error(error: ValidationError) -> str:
+    """Compact one-line summary of a validation error for batch results"""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'body'}: {detail['msg']}" for detail in error.errors()
+    )
+
+class PreviewError(ValueError):
+    pass
+
+class PreviewSession:
+    """One /api/preview connection: the brief as typed so far and its live rendering"""
+
+    def __init__(self):
+        self.brief: Dict[str, Any] = {}
+        self.request: Optional[PromptRequest] = None
+        self.version: Optional[str] = None
+        self.render: Optional[LiveRender] = None
+
+    def update(self, fields: Dict[str, Any]) -> dict:
+        """Apply changed fields; returns a snapshot for a new template, else a patch of changed segments.
+
+        An invalid change raises PreviewError and leaves the session as it was.
+        """
+        unknown = [name for name in fields if name not in PromptRequest.model_fields]
+        if unknown:
+            raise PreviewError(f"Unknown fields: {', '.join(unknown)}")
+        brief = {**self.brief, **fields}
+        try:
+            request = PromptRequest.model_validate(brief)
+        except ValidationError as e:
+            raise PreviewError(batch_error(e))
+        version = TEMPLATES.current.get(request.mode)
+        if not version:
+            raise PreviewError(f"Invalid mode: {request.mode}")
+        self.brief, self.request = brief, request
+        values = prompt_values(request)
+        if version != self.version:
+            self.version = version
+            self.render = LiveRender(TEMPLATES.get(version), values)
+            return {'type': 'snapshot', 'mode': request.mode, 'version': version, 'segments': self.render.segments}
+        # Placeholder names match PromptRequest fields, so only the changed fields' slots are re-rendered
+        return {'type': 'patch', 'segments': self.render.update(values, fields)}
+
+    async def save(self) -> dict:
+        if self.request is None:
+            raise PreviewError("Nothing to save yet")
+        prompt_response = PromptResponse(mode=self.request.mode, generated_prompt=self.render.text)
+        await save_prompt(prompt_document(prompt_response, self.request))
+        return {'type': 'saved', 'prompt': prompt_response.model_dump()}
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
@@ -305,34 +844,467 @@ async def create_prompt(request: PromptRequest):
         )
         
         # Store in database
-        prompt_dict = prompt_response.dict()
-        prompt_dict['request_data'] = request.dict()
-        await db.prompts.insert_one(prompt_dict)
+        await save_prompt(prompt_document(prompt_response, request))
         
-        return prompt_response
+        # Already a validated model; skip response_model re-validation
+        with stage('serialize'):
+            return FastJSONResponse(prompt_response.model_dump())
+    except WriteBehindFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/generate-prompt/stream")
+async def create_prompt_stream(request: PromptRequest, format: str = Query("ndjson", pattern="^(ndjson|sse)$")):
+    version = TEMPLATES.current.get(request.mode)
+    if not version:
+        raise HTTPException(status_code=400, detail=f"Invalid mode: {request.mode}")
+    prompt_response = PromptResponse(mode=request.mode, generated_prompt="")
+
+    # Persist in the background; the document holds only inputs and version, so it doesn't need the text
+    run_in_background(save_prompt(prompt_document(prompt_response, request)))
+
+    async def events():
+        yield stream_event(format, "meta", prompt_response.model_dump(exclude={'generated_prompt'}))
+        values = prompt_values(request)
+        length = 0
+        for name, template in TEMPLATES.sections(version, STREAM_SECTIONS):
+            text = template.render(values)
+            length += len(text)
+            yield stream_event(format, "section", {"name": name, "text": text})
+        yield stream_event(format, "done", {"length": length})
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+@api_router.websocket("/preview")
+async def preview_prompt(websocket: WebSocket):
+    """Live preview of a brief as it is edited; nothing is stored until the client sends `save`.
+
+    Client messages are JSON objects with an optional `seq` that the reply echoes:
+    `{"type": "update", "fields": {...}}` merges changed fields into the brief
+    (the first update carries the whole brief) and `{"type": "save"}` stores
+    the current prompt. Replies are `snapshot` (every segment of the prompt,
+    sent for the first valid brief and whenever the mode changes), `patch`
+    (`[index, text]` for each segment that changed), `saved` or `error`.
+    Joining the segments in order gives the prompt text.
+    """
+    await websocket.accept()
+    session = PreviewSession()
+    try:
+        while True:
+            text = await websocket.receive_text()
+            seq = None
+            try:
+                message = orjson.loads(text)
+                if not isinstance(message, dict):
+                    raise PreviewError("Expected a JSON object")
+                seq = message.get('seq')
+                if message.get('type') == 'update':
+                    fields = message.get('fields')
+                    if not isinstance(fields, dict):
+                        raise PreviewError("update needs a `fields` object")
+                    reply = session.update(fields)
+                elif message.get('type') == 'save':
+                    reply = await session.save()
+                else:
+                    raise PreviewError(f"Unknown message type: {message.get('type')}")
+            except (orjson.JSONDecodeError, PreviewError, WriteBehindFull) as e:
+                reply = {'type': 'error', 'detail': str(e)}
+            except Exception:
+                logger.exception("Preview message failed")
+                reply = {'type': 'error', 'detail': "Internal error"}
+            await websocket.send_text(orjson.dumps({**reply, 'seq': seq}, option=orjson.OPT_UTC_Z).decode())
+    except WebSocketDisconnect:
+        pass
+
+@api_router.post("/generate-prompts/batch", response_model=BatchPromptResponse)
+async def create_prompts_batch(items: List[Any] = Body(...)):
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(items)} items (max {MAX_BATCH_SIZE})")
+
+    # Validate and render each brief on its own so one bad item doesn't fail the batch
+    results = []
+    documents = []
+    for index, item in enumerate(items):
+        try:
+            request = PromptRequest.model_validate(item)
+            prompt_response = PromptResponse(mode=request.mode, generated_prompt=generate_prompt(request))
+        except ValidationError as e:
+            results.append(BatchItemResult(index=index, ok=False, error=batch_error(e)))
+            continue
+        except HTTPException as e:
+            results.append(BatchItemResult(index=index, ok=False, error=e.detail))
+            continue
+        results.append(BatchItemResult(index=index, ok=True, result=prompt_response))
+        documents.append((len(results) - 1, prompt_document(prompt_response, request)))
+
+    # Persist every success in one round trip; unordered so a failed write doesn't stop the rest
+    if documents:
+        try:
+            errors = await storage.insert_many('prompts', [document for _, document in documents])
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        await prompts_stored([document for _, document in documents], errors)
+        for index, error in errors:
+            position = documents[index][0]
+            results[position] = BatchItemResult(index=results[position].index, ok=False, error=error)
+
+    succeeded = sum(1 for result in results if result.ok)
+    response = BatchPromptResponse(results=results, succeeded=succeeded, failed=len(results) - succeeded)
+    with stage('serialize'):
+        return FastJSONResponse(response.model_dump())
+
+def matrix_axes(base: PromptRequest, vary: Dict[str, List[Any]]) -> List[List[tuple]]:
+    """Validated (field, value, template value) options for each varying field.
+
+    Each value is validated once against the base brief, so a 5x4x6 matrix
+    costs 15 validations rather than 120.
+    """
+    base_data = base.model_dump()
+    axes = []
+    for field, options in vary.items():
+        if field == 'mode' or field not in PromptRequest.model_fields:
+            raise HTTPException(status_code=400, detail=f"Field cannot be varied: {field}")
+        if not options:
+            raise HTTPException(status_code=400, detail=f"No values given for {field}")
+        axis = []
+        for option in options:
+            try:
+                request = PromptRequest.model_validate({**base_data, field: option})
+            except ValidationError as e:
+                raise HTTPException(status_code=422, detail=batch_error(e))
+            axis.append((field, getattr(request, field), prompt_values(request)[field]))
+        axes.append(axis)
+    return axes
+
+@api_router.post("/generate-prompts/matrix", response_model=MatrixPromptResponse)
+async def create_prompt_matrix(matrix: PromptMatrixRequest):
+    base = matrix.base
+    version = TEMPLATES.current.get(base.mode)
+    if not version:
+        raise HTTPException(status_code=400, detail=f"Invalid mode: {base.mode}")
+    size = 1
+    for options in matrix.vary.values():
+        size *= len(options)
+    if size > MAX_MATRIX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Matrix too large: {size} combinations (max {MAX_MATRIX_SIZE})")
+    axes = matrix_axes(base, matrix.vary)
+
+    # Everything that doesn't depend on the varying fields is rendered once, up front
+    base_data = base.model_dump()
+    template = TEMPLATES.get(version).bind(
+        {field: value for field, value in prompt_values(base).items() if field not in matrix.vary}
+    )
+    results = []
+    documents = []
+    for combination in itertools.product(*axes):
+        values = {field: value for field, value, _ in combination}
+        prompt_response = PromptResponse(
+            mode=base.mode,
+            generated_prompt=template.render({field: rendered for field, _, rendered in combination}),
+        )
+        # Every field was validated by matrix_axes
+        request = PromptRequest.model_construct(**{**base_data, **values})
+        results.append({'values': values, 'ok': True, 'result': prompt_response.model_dump(), 'error': None})
+        documents.append(prompt_document(prompt_response, request))
+
+    try:
+        errors = await storage.insert_many('prompts', documents)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    await prompts_stored(documents, errors)
+    for index, error in errors:
+        results[index].update(ok=False, result=None, error=error)
 
-@api_router.get("/prompts", response_model=List[PromptResponse])
-async def get_prompts():
-    prompts = await db.prompts.find().to_list(100)
-    return [PromptResponse(**{k: v for k, v in prompt.items() if k != 'request_data'}) for prompt in prompts]
+    with stage('serialize'):
+        return FastJSONResponse({'results': results, 'succeeded': len(results) - len(errors), 'failed': len(errors)})
+
+@api_router.get("/prompts", response_model=PromptPage)
+async def get_prompts(
+    http_request: Request,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    mode: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    headers = CHANGE_MARKERS['prompts'].headers(http_request.url.query)
+    if is_not_modified(http_request.headers, headers, CHANGE_MARKERS['prompts']):
+        return Response(status_code=304, headers=headers)
+    query = page_query(cursor, since, until, mode=mode)
+    prompts = await find_prompt_page(query, limit + 1)
+    await load_template_versions(prompts[:limit])
+    # Rows come from our own storage, so serialize them directly instead of validating each into a model
+    return FastJSONResponse({
+        'items': [prompt_item(hydrate_prompt(prompt)) for prompt in prompts[:limit]],
+        'next_cursor': next_cursor(prompts, limit),
+    }, headers=headers)
+
+@api_router.get("/prompts/search", response_model=PromptSearchPage)
+async def search_prompts(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    mode: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    try:
+        offset = decode_offset_cursor(cursor) if cursor else 0
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    limit = min(limit, MAX_SEARCH_RESULTS - offset)
+    if limit <= 0:
+        return FastJSONResponse({'items': [], 'next_cursor': None})
+    matches = await storage.search('prompts', q, page_query(None, since, until, mode=mode), limit + 1, offset)
+    documents = [document for _, document in matches[:limit]]
+    await load_template_versions(documents)
+    return FastJSONResponse({
+        'items': [
+            {**prompt_item(hydrate_prompt(document)), 'score': score}
+            for (score, _), document in zip(matches, documents)
+        ],
+        'next_cursor': encode_offset_cursor(offset + limit) if len(matches) > limit else None,
+    })
+
+@api_router.get("/prompts/export")
+async def export_prompts(
+    mode: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to include (default: all)"),
+    batch_size: int = Query(1000, ge=1, le=10000),
+    gzip: bool = False,
+):
+    selected = [field.strip() for field in fields.split(',') if field.strip()] if fields else list(EXPORT_FIELDS)
+    unknown = [field for field in selected if field not in EXPORT_FIELDS]
+    if unknown or not selected:
+        raise HTTPException(status_code=400, detail=f"Unknown export fields: {', '.join(unknown)}; allowed: {', '.join(EXPORT_FIELDS)}")
+
+    # Rendering generated_prompt for compact documents needs their inputs and template version
+    projection = list(selected)
+    if 'generated_prompt' in selected:
+        projection += ['template_version', 'request_data', 'mode']
+    documents = stream_prompts(page_query(None, since, until, mode=mode), projection, batch_size)
+
+    chunks = ndjson_chunks(documents, selected, batch_size)
+    if gzip:
+        return StreamingResponse(
+            gzip_chunks(chunks),
+            media_type="application/gzip",
+            headers={"Content-Disposition": 'attachment; filename="prompts.ndjson.gz"'},
+        )
+    return StreamingResponse(chunks, media_type="application/x-ndjson")
+
+@api_router.post("/prompts/upload", status_code=202)
+async def upload_briefs(request: Request, format: Optional[str] = Query(None, pattern="^(csv|ndjson)$")):
+    """Accept a CSV or NDJSON file of briefs as the multipart field `file`; poll the returned job for progress"""
+    file = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix='bizbuddy-upload-', delete=False)
+    try:
+        with file:
+            filename, content_type, size = await receive_upload(
+                request.stream(), request.headers.get('content-type', ''), file, max_bytes=MAX_UPLOAD_BYTES
+            )
+        upload_format = detect_format(format, filename, content_type)
+        if upload_format is None:
+            raise UploadError("Cannot tell the file format; name it .csv or .ndjson or pass ?format=")
+    except UploadTooLarge as e:
+        remove_file(file.name)
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        remove_file(file.name)
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        remove_file(file.name)
+        raise
+
+    job = jobs.add(Job(upload_format, filename, file.name, size))
+    run_in_background(process_upload(job), job_tasks)
+    return FastJSONResponse(
+        {'job_id': job.id, 'status': job.status, 'status_url': f"/api/jobs/{job.id}"}, status_code=202
+    )
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return FastJSONResponse(job.to_dict())
+
+@api_router.get("/analytics/usage", response_model=UsageReport)
+async def get_usage(
+    dimension: str = Query("mode", pattern="^(" + "|".join(USAGE_DIMENSIONS) + ")$"),
+    days: int = Query(30, ge=1, le=366),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+):
+    # Reads only the daily counters: one document per day and value, however many prompts there are
+    starts = recent_days(datetime.now(timezone.utc), days)
+    positions = {start: position for position, start in enumerate(starts)}
+    series: Dict[str, List[int]] = {}
+    # Bounded at tomorrow: another instance with a clock running ahead may have counted a later day
+    query = StorageQuery(equals={'dimension': dimension}, since=starts[0], until=starts[-1] + timedelta(days=1))
+    async for counter in storage.stream('usage_daily', query):
+        if not counter['count']:
+            # Zeroed by rebuild_usage.py
+            continue
+        counts = series.setdefault(counter['value'], [0] * days)
+        counts[positions[day_start(counter['timestamp'])]] += counter['count']
+    ranked = sorted(series.items(), key=lambda item: (-sum(item[1]), item[0]))
+    other = [sum(day) for day in zip(*(counts for _, counts in ranked[limit:]))] if len(ranked) > limit else None
+    return FastJSONResponse({
+        'dimension': dimension,
+        'day_starts': starts,
+        'values': [{'value': value, 'total': sum(counts), 'counts': counts} for value, counts in ranked[:limit]],
+        'other': {'values': len(ranked) - limit, 'total': sum(other), 'counts': other} if other else None,
+        'total': sum(sum(counts) for counts in series.values()),
+    })
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.expose(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    return render_cache.stats()
+
+@api_router.get("/write-behind/stats")
+async def get_write_behind_stats():
+    return {"enabled": WRITE_BEHIND_ENABLED, **write_behind.stats()}
+
+@api_router.get("/admission/stats")
+async def get_admission_stats():
+    outcomes = {labels[0]: count for labels, count in ADMISSION_OUTCOMES.values.items()}
+    return {
+        "in_flight": concurrency_limit.in_flight,
+        "queued_now": concurrency_limit.queued,
+        "max_in_flight": concurrency_limit.limit,
+        "max_queued": concurrency_limit.max_queue,
+        "rate_limit_per_second": rate_limits.rate,
+        "rate_limit_burst": rate_limits.burst,
+        "tracked_clients": len(rate_limits),
+        "admitted": outcomes.get('admitted', 0),
+        "queued": outcomes.get('queued', 0),
+        "shed": {reason: outcomes.get(reason, 0) for reason in ('rate_limited', 'queue_full', 'queue_timeout')},
+    }
+
+@api_router.get("/debug/slow")
+async def get_slow_requests():
+    return FastJSONResponse({
+        "sample_rate": REQUEST_TIMING_SAMPLE_RATE,
+        "capacity": slow_requests.capacity,
+        "sampled": slow_requests.sampled,
+        "requests": slow_requests.entries(),
+    })
 
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
-    status_dict = input.dict()
-    status_obj = StatusCheck(**status_dict)
-    await db.status_checks.insert_one(status_obj.dict())
-    return status_obj
+    status_obj = StatusCheck(client_name=input.client_name)
+    status_dict = status_obj.model_dump()
+    await storage.insert('status_checks', status_dict)
+    CHANGE_MARKERS['status_checks'].touch()
+    # Rollups outlive the raw document; each counter is upserted atomically
+    client, buckets = status_increments(status_obj.client_name, status_obj.timestamp)
+    await asyncio.gather(storage.increment('status_clients', [client]), storage.increment('status_rollups', buckets))
+    return FastJSONResponse(status_dict)
 
-@api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+@api_router.get("/status", response_model=StatusCheckPage)
+async def get_status_checks(
+    http_request: Request,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    headers = CHANGE_MARKERS['status_checks'].headers(http_request.url.query)
+    if is_not_modified(http_request.headers, headers, CHANGE_MARKERS['status_checks']):
+        return Response(status_code=304, headers=headers)
+    query = page_query(cursor, since, until)
+    status_checks = await storage.find_page('status_checks', query, limit + 1)
+    return FastJSONResponse({
+        'items': [
+            {'id': row['id'], 'client_name': row['client_name'], 'timestamp': row['timestamp']}
+            for row in status_checks[:limit]
+        ],
+        'next_cursor': next_cursor(status_checks, limit),
+    }, headers=headers)
+
+@api_router.get("/status/summary", response_model=StatusSummary)
+async def get_status_summary(
+    granularity: str = Query("hour", pattern="^(minute|hour)$"),
+    buckets: int = Query(24, ge=1, le=168),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    # Reads one totals row per client plus a fixed set of bucket ids, however long the history
+    clients = await storage.find_page('status_clients', page_query(cursor, None, None), limit + 1)
+    starts = recent_buckets(datetime.now(timezone.utc), granularity, buckets)
+    ids = {
+        client['client_name']: [bucket_id(granularity, client['client_name'], start) for start in starts]
+        for client in clients[:limit]
+    }
+    rollups = await storage.find_in('status_rollups', [id for client_ids in ids.values() for id in client_ids])
+    counts = {rollup['id']: rollup['count'] for rollup in rollups}
+    return FastJSONResponse({
+        'granularity': granularity,
+        'bucket_starts': starts,
+        'clients': [
+            {
+                'client_name': client['client_name'],
+                'count': client['count'],
+                'first_seen': client['first_seen'],
+                'last_seen': client['last_seen'],
+                'counts': [counts.get(id, 0) for id in ids[client['client_name']]],
+            }
+            for client in clients[:limit]
+        ],
+        'next_cursor': next_cursor(clients, limit),
+    })
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Counters owned by other components, read when /api/metrics is scraped
+metrics.callback(
+    'bizbuddy_render_cache_events_total', 'Render cache lookups and removals by event',
+    lambda: {(event,): render_cache.stats()[event] for event in ('hits', 'misses', 'evictions', 'expirations')},
+    ('event',), kind='counter')
+metrics.callback(
+    'bizbuddy_render_cache_bytes', 'Approximate memory held by the render cache',
+    lambda: {(): render_cache.bytes_used})
+metrics.callback(
+    'bizbuddy_write_behind_queue_depth', 'Prompt documents waiting to be flushed',
+    lambda: {(): write_behind.depth})
+metrics.callback(
+    'bizbuddy_write_behind_documents_total', 'Write-behind documents by outcome',
+    lambda: {
+        ('flushed',): write_behind.flushed, ('failed',): write_behind.failed,
+        ('rejected',): write_behind.rejected,
+    },
+    ('outcome',), kind='counter')
+metrics.callback(
+    'bizbuddy_write_behind_flush_seconds', 'Latency of the most recent and the slowest write-behind flush',
+    lambda: {('last',): write_behind.last_flush_seconds, ('max',): write_behind.max_flush_seconds},
+    ('stat',))
+
+metrics.callback(
+    'bizbuddy_admission_in_flight', 'Generation requests holding or waiting for a concurrency slot',
+    lambda: {('running',): concurrency_limit.in_flight, ('queued',): concurrency_limit.queued},
+    ('state',))
+
+# Inside the metrics middleware so shed requests are counted and timed too
+app.add_middleware(
+    AdmissionMiddleware,
+    buckets=rate_limits,
+    limiter=concurrency_limit,
+    outcomes=ADMISSION_OUTCOMES,
+    key_header=RATE_LIMIT_KEY_HEADER,
+)
+# Outside admission control, so time spent queued for a slot shows up in the total
+app.add_middleware(
+    TimingMiddleware, log=slow_requests, sample_rate=REQUEST_TIMING_SAMPLE_RATE, header=SERVER_TIMING_HEADER)
+app.add_middleware(MetricsMiddleware, requests=HTTP_REQUESTS, latency=HTTP_LATENCY, in_flight=HTTP_IN_FLIGHT)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -348,6 +1320,89 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def create_indexes():
+    # Compound indexes for the keyset-paginated list queries; creating them again is a no-op.
+    # Each step is tried on its own, so one failing (e.g. a conflicting text index) doesn't skip the rest
+    steps = {
+        'list indexes': storage.ensure_indexes,
+        'the search index': lambda: storage.ensure_text_index('prompts', SEARCH_FIELDS),
+    }
+    if STATUS_TTL_SECONDS > 0:
+        steps['the status check TTL'] = lambda: storage.ensure_ttl('status_checks', STATUS_TTL_SECONDS)
+    if STATUS_ROLLUP_TTL_SECONDS > 0:
+        steps['the status rollup TTL'] = lambda: storage.ensure_ttl('status_rollups', STATUS_ROLLUP_TTL_SECONDS)
+    for name, step in steps.items():
+        try:
+            await step()
+        except Exception:
+            logger.exception("Failed to create %s", name)
+
+async def purge_expired() -> None:
+    purged = await storage.purge_expired()
+    for collection, count in purged.items():
+        # An unknown count (MongoDB's TTL monitor) may have changed the listing, so it counts as a change
+        if (count is None or count) and collection in CHANGE_MARKERS:
+            CHANGE_MARKERS[collection].touch()
+
+async def purge_expired_periodically():
+    while True:
+        await asyncio.sleep(TTL_PURGE_INTERVAL_SECONDS)
+        try:
+            await purge_expired()
+        except Exception:
+            logger.exception("Failed to purge expired documents")
+
+ttl_purge_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_ttl_purge():
+    global ttl_purge_task
+    ttl_purge_task = asyncio.create_task(purge_expired_periodically())
+
+async def register_templates():
+    try:
+        await register_template_versions()
+    except Exception:
+        logger.exception("Failed to register template versions")
+
+@app.on_event("startup")
+async def initialize():
+    if PREWARM_TEMPLATES:
+        TEMPLATES.prewarm((STREAM_SECTIONS,))
+    # Independent storage round trips; startup waits for the slowest rather than their sum
+    await asyncio.gather(create_indexes(), register_templates())
+
+@app.on_event("startup")
+async def start_write_behind():
+    if WRITE_BEHIND_ENABLED:
+        write_behind.start()
+
+async def archive_periodically():
+    while True:
+        try:
+            moved = await archive_prompts()
+        except Exception:
+            logger.exception("Failed to archive prompts")
+        else:
+            if moved:
+                logger.info("Archived %d prompts older than %g days", moved, PROMPT_ARCHIVE_AFTER_DAYS)
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+archive_task: Optional[asyncio.Task] = None
+
+# Registered after initialize, so the archive collection and its indexes exist before the first move
+@app.on_event("startup")
+async def start_archiver():
+    global archive_task
+    if PROMPT_ARCHIVE_AFTER_DAYS > 0:
+        archive_task = asyncio.create_task(archive_periodically())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    # Finish background saves and flush queued prompts before the storage backend goes away
+    for task in (ttl_purge_task, archive_task, *job_tasks):
+        if task is not None:
+            task.cancel()
+    await asyncio.gather(*job_tasks, *background_tasks, return_exceptions=True)
+    await write_behind.close()
+    await storage.close()
\ No newline at end of file
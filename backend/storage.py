@@ -0,0 +1,934 @@
+"""Storage backends for prompts, status checks and template versions.
+
+Route handlers talk to a `Storage` instead of a Motor database, so the same
+app runs against MongoDB, an embedded SQLite file or a plain in-process dict.
+Every collection holds JSON-like documents keyed by their `id` field, and list
+queries always return newest first by (timestamp, id), which is what the
+keyset pagination in pagination.py expects.
+
+The backend is chosen by STORAGE_BACKEND (`mongo`, `sqlite` or `memory`);
+see `storage_from_env`.
+"""
+import asyncio
+import bisect
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from pagination import KEYSET_SORT, keyset_query
+
+logger = logging.getLogger(__name__)
+
+# (index in the submitted list, error message) for each document a bulk insert rejected
+InsertErrors = List[Tuple[int, str]]
+
+# (id, fields to set, fields to remove) for update_fields
+FieldUpdate = Tuple[str, Dict[str, Any], Sequence[str]]
+
+
+@dataclass
+class Increment:
+    """Upsert of one counter document, applied atomically per document by `Storage.increment`"""
+
+    id: str
+    # Fields written only when the document is created
+    on_insert: Dict[str, Any] = field(default_factory=dict)
+    # Numbers added to the stored values (missing counts as 0)
+    inc: Dict[str, float] = field(default_factory=dict)
+    # Fields that keep the smaller / larger of the stored and given value
+    min: Dict[str, Any] = field(default_factory=dict)
+    max: Dict[str, Any] = field(default_factory=dict)
+
+    def created(self) -> dict:
+        return {'id': self.id, **self.on_insert, **self.inc, **self.min, **self.max}
+
+
+@dataclass
+class Query:
+    """Filter for list queries: equality on (dotted) fields, a time range and a keyset position"""
+
+    equals: Dict[str, Any] = field(default_factory=dict)
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    # Sort key of the last row already returned; results start strictly after it
+    after: Optional[Tuple[datetime, str]] = None
+
+
+def utc_naive(value: datetime) -> datetime:
+    """Normalize to naive UTC, the form MongoDB returns, so all backends compare alike"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def get_path(document: dict, path: str) -> Any:
+    for part in path.split('.'):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+def _naive(value: Any) -> Any:
+    return utc_naive(value) if isinstance(value, datetime) else value
+
+
+def apply_increment(document: dict, update: Increment) -> None:
+    """Apply the counter part of an update to an existing document in place"""
+    for name, amount in update.inc.items():
+        document[name] = document.get(name, 0) + amount
+    for name, value in update.min.items():
+        value = _naive(value)
+        if document.get(name) is None or value < _naive(document[name]):
+            document[name] = value
+    for name, value in update.max.items():
+        value = _naive(value)
+        if document.get(name) is None or value > _naive(document[name]):
+            document[name] = value
+
+
+def copy_document(value: Any) -> Any:
+    """Copy of a JSON-like document, cheaper than copy.deepcopy"""
+    if isinstance(value, dict):
+        return {key: copy_document(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_document(item) for item in value]
+    return value
+
+
+def project(document: dict, fields: Optional[Sequence[str]]) -> dict:
+    if fields is None:
+        return document
+    return {name: document[name] for name in fields if name in document}
+
+
+class Storage:
+    """Interface every backend implements"""
+
+    name = "base"
+
+    async def ensure_indexes(self) -> None:
+        """Create whatever indexes the list queries need; safe to call repeatedly"""
+
+    async def insert(self, collection: str, document: dict) -> None:
+        raise NotImplementedError
+
+    async def insert_many(self, collection: str, documents: List[dict]) -> InsertErrors:
+        """Insert all documents, continuing past failures, and report the ones that failed"""
+        raise NotImplementedError
+
+    async def insert_if_absent(self, collection: str, document: dict) -> bool:
+        """Insert unless a document with the same id exists; returns whether it was inserted"""
+        raise NotImplementedError
+
+    async def find_page(self, collection: str, query: Query, limit: int) -> List[dict]:
+        """Up to `limit` matching documents, newest first"""
+        raise NotImplementedError
+
+    async def find_in(self, collection: str, ids: Sequence[str]) -> List[dict]:
+        raise NotImplementedError
+
+    async def stream(
+        self, collection: str, query: Query, fields: Optional[Sequence[str]] = None, batch_size: int = 1000
+    ) -> AsyncIterator[dict]:
+        """Every matching document, newest first, fetched `batch_size` at a time"""
+        query = Query(query.equals, query.since, query.until, query.after)
+        while True:
+            documents = await self.find_page(collection, query, batch_size)
+            for document in documents:
+                yield project(document, fields)
+            if len(documents) < batch_size:
+                return
+            last = documents[-1]
+            query.after = (last['timestamp'], last['id'])
+
+    async def update_fields(self, collection: str, updates: List[FieldUpdate]) -> None:
+        raise NotImplementedError
+
+    async def increment(self, collection: str, updates: List[Increment]) -> None:
+        """Create or update counter documents; each document's update is atomic"""
+        raise NotImplementedError
+
+    async def ensure_ttl(self, collection: str, seconds: float) -> None:
+        """Expire documents whose timestamp is more than `seconds` old.
+
+        Backends without native expiry delete them when purge_expired runs.
+        """
+        self._ttl[collection] = seconds
+
+    async def purge_expired(self) -> Dict[str, Optional[int]]:
+        """Delete documents past their collection's TTL; returns how many per collection.
+
+        None for a collection means the backend expires documents on its own and
+        can't tell how many went.
+        """
+        now = datetime.now(timezone.utc)
+        purged = {}
+        for collection, seconds in self._ttl.items():
+            purged[collection] = await self.delete_before(collection, now - timedelta(seconds=seconds))
+        return purged
+
+    async def delete_before(self, collection: str, cutoff: datetime) -> int:
+        """Delete documents with a timestamp older than `cutoff`; returns how many"""
+        raise NotImplementedError
+
+    async def move_before(self, source: str, destination: str, cutoff: datetime, limit: int) -> int:
+        """Move up to `limit` of the oldest documents with a timestamp before `cutoff`; returns how many.
+
+        Documents are written to `destination` before they leave `source`, so a
+        reader may briefly find one in both but never in neither. Documents
+        already in `destination` (from an interrupted move) are not copied again.
+        """
+        raise NotImplementedError
+
+    async def ensure_text_index(self, collection: str, fields: Dict[str, float]) -> None:
+        """Make the (dotted) string fields searchable by `search`, each with a relevance weight"""
+        raise NotImplementedError
+
+    async def search(self, collection: str, text: str, query: Query, limit: int, offset: int = 0) -> List[Tuple[float, dict]]:
+        """(score, document) for documents matching any word of `text`, most relevant first.
+
+        Only the equality and time-range parts of `query` apply.
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MotorStorage(Storage):
+    """MongoDB through Motor; documents keep Mongo's `_id` out of every result"""
+
+    name = "mongo"
+
+    def __init__(self, url: Optional[str], database: Optional[str]):
+        self.url = url
+        self.database = database
+        self._client = None
+        self._db = None
+        self._ttl: Dict[str, float] = {}
+
+    @property
+    def db(self):
+        # Motor is imported and the client built on first use, keeping both off the import path
+        if self._db is None:
+            if not self.url or not self.database:
+                raise RuntimeError("MONGO_URL and DB_NAME must be set for STORAGE_BACKEND=mongo")
+            from motor.motor_asyncio import AsyncIOMotorClient
+
+            self._client = AsyncIOMotorClient(self.url)
+            self._db = self._client[self.database]
+        return self._db
+
+    async def ensure_indexes(self) -> None:
+        # Each index is created even if another fails; the first failure is raised afterwards
+        db = self.db
+        try:
+            await self._create_archive()
+            results = []
+        except Exception as e:
+            results = [e]
+        results += await asyncio.gather(
+            db.prompts.create_index(KEYSET_SORT),
+            db.prompts.create_index([("mode", 1)] + KEYSET_SORT),
+            db.prompts_archive.create_index(KEYSET_SORT),
+            db.prompts_archive.create_index([("mode", 1)] + KEYSET_SORT),
+            db.prompts_archive.create_index('id', unique=True),
+            db.status_checks.create_index(KEYSET_SORT),
+            db.prompt_templates.create_index('id', unique=True),
+            # Counter upserts look documents up by id
+            db.status_rollups.create_index('id', unique=True),
+            db.status_clients.create_index('id', unique=True),
+            db.status_clients.create_index(KEYSET_SORT),
+            db.usage_daily.create_index('id', unique=True),
+            db.usage_daily.create_index([("dimension", 1)] + KEYSET_SORT),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+
+    async def _create_archive(self) -> None:
+        # Archived prompts are rarely read, so trade some CPU on those reads for zstd's smaller blocks.
+        # Runs before the archive's indexes, which would create the collection with the defaults
+        from pymongo.errors import CollectionInvalid, OperationFailure
+
+        if await self.db.list_collection_names(filter={'name': 'prompts_archive'}):
+            return
+        try:
+            try:
+                await self.db.create_collection(
+                    'prompts_archive', storageEngine={'wiredTiger': {'configString': 'block_compressor=zstd'}}
+                )
+            except OperationFailure as e:
+                # E.g. a managed cluster that doesn't allow storageEngine options
+                logger.warning("Creating prompts_archive with zstd compression failed (%s); using the defaults", e)
+                await self.db.create_collection('prompts_archive')
+        except CollectionInvalid:
+            pass  # Created by another instance in the meantime
+
+    async def insert(self, collection: str, document: dict) -> None:
+        # insert_one adds _id to the dict it is given; keep the caller's copy clean
+        await self.db[collection].insert_one(dict(document))
+
+    async def insert_many(self, collection: str, documents: List[dict]) -> InsertErrors:
+        from pymongo.errors import BulkWriteError
+
+        try:
+            await self.db[collection].insert_many([dict(document) for document in documents], ordered=False)
+        except BulkWriteError as e:
+            return [(error['index'], error.get('errmsg', 'Write failed')) for error in e.details.get('writeErrors', [])]
+        return []
+
+    async def insert_if_absent(self, collection: str, document: dict) -> bool:
+        result = await self.db[collection].update_one(
+            {'id': document['id']}, {'$setOnInsert': document}, upsert=True
+        )
+        return result.upserted_id is not None
+
+    async def find_page(self, collection: str, query: Query, limit: int) -> List[dict]:
+        cursor = self.db[collection].find(self._filter(query), {'_id': 0}).sort(KEYSET_SORT).limit(limit)
+        return await cursor.to_list(limit)
+
+    async def find_in(self, collection: str, ids: Sequence[str]) -> List[dict]:
+        return await self.db[collection].find({'id': {'$in': list(ids)}}, {'_id': 0}).to_list(None)
+
+    async def stream(
+        self, collection: str, query: Query, fields: Optional[Sequence[str]] = None, batch_size: int = 1000
+    ) -> AsyncIterator[dict]:
+        projection = {'_id': 0}
+        if fields is not None:
+            projection.update((name, 1) for name in fields)
+        cursor = self.db[collection].find(self._filter(query), projection, batch_size=batch_size).sort(KEYSET_SORT)
+        async for document in cursor:
+            yield document
+
+    async def update_fields(self, collection: str, updates: List[FieldUpdate]) -> None:
+        from pymongo import UpdateOne
+
+        operations = []
+        for id, set_fields, unset_fields in updates:
+            update = {}
+            if set_fields:
+                update['$set'] = set_fields
+            if unset_fields:
+                update['$unset'] = {name: '' for name in unset_fields}
+            operations.append(UpdateOne({'id': id}, update))
+        if operations:
+            await self.db[collection].bulk_write(operations, ordered=False)
+
+    async def increment(self, collection: str, updates: List[Increment]) -> None:
+        from pymongo import UpdateOne
+
+        operations = []
+        for update in updates:
+            operators = {'$setOnInsert': update.on_insert, '$inc': update.inc, '$min': update.min, '$max': update.max}
+            operations.append(UpdateOne(
+                {'id': update.id}, {name: value for name, value in operators.items() if value}, upsert=True
+            ))
+        if operations:
+            await self.db[collection].bulk_write(operations, ordered=False)
+
+    async def ensure_ttl(self, collection: str, seconds: float) -> None:
+        # MongoDB's TTL monitor does the deleting; purge_expired only reports which collections expire
+        from pymongo.errors import OperationFailure
+
+        try:
+            await self.db[collection].create_index('timestamp', expireAfterSeconds=int(seconds))
+        except OperationFailure as e:
+            if e.code != 85:  # IndexOptionsConflict: the index exists with another expiry
+                raise
+            await self.db.command(
+                'collMod', collection, index={'keyPattern': {'timestamp': 1}, 'expireAfterSeconds': int(seconds)}
+            )
+        self._ttl[collection] = seconds
+
+    async def purge_expired(self) -> Dict[str, Optional[int]]:
+        # The TTL monitor deletes on its own schedule; any of these may have lost documents
+        return {collection: None for collection in self._ttl}
+
+    async def delete_before(self, collection: str, cutoff: datetime) -> int:
+        result = await self.db[collection].delete_many({'timestamp': {'$lt': cutoff}})
+        return result.deleted_count
+
+    async def move_before(self, source: str, destination: str, cutoff: datetime, limit: int) -> int:
+        from pymongo.errors import BulkWriteError
+
+        documents = await (
+            self.db[source].find({'timestamp': {'$lt': cutoff}}, {'_id': 0})
+            .sort([('timestamp', 1), ('id', 1)])
+            .limit(limit)
+            .to_list(limit)
+        )
+        if not documents:
+            return 0
+        ids = [document['id'] for document in documents]
+        try:
+            await self.db[destination].insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate ids were copied by an earlier run that stopped before deleting them
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+        await self.db[source].delete_many({'id': {'$in': ids}})
+        return len(ids)
+
+    async def ensure_text_index(self, collection: str, fields: Dict[str, float]) -> None:
+        # A collection can have only one text index; it covers every searchable field
+        await self.db[collection].create_index(
+            [(name, 'text') for name in fields], weights=fields, name=f'{collection}_text', default_language='english'
+        )
+
+    async def search(self, collection: str, text: str, query: Query, limit: int, offset: int = 0) -> List[Tuple[float, dict]]:
+        filter = keyset_query(None, query.since, query.until, **query.equals)
+        filter['$text'] = {'$search': text}
+        score = {'$meta': 'textScore'}
+        cursor = (
+            self.db[collection].find(filter, {'_id': 0, '_score': score})
+            .sort([('_score', score), ('timestamp', -1), ('id', -1)])
+            .skip(offset)
+            .limit(limit)
+        )
+        return [(document.pop('_score'), document) async for document in cursor]
+
+    async def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = self._db = None
+
+    @staticmethod
+    def _filter(query: Query) -> dict:
+        return keyset_query(query.after, query.since, query.until, **query.equals)
+
+
+class MemoryStorage(Storage):
+    """Process-local storage for single-node deployments, local runs and benchmarks.
+
+    Each collection keeps its documents in a list sorted by (timestamp, id),
+    so pages are a bisect plus a slice. Nothing survives a restart.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._keys: Dict[str, List[Tuple[datetime, str]]] = {}
+        self._documents: Dict[str, List[dict]] = {}
+        self._by_id: Dict[str, Dict[str, dict]] = {}
+        self._ttl: Dict[str, float] = {}
+        self._text_indexes: Dict[str, Any] = {}
+
+    def _collection(self, collection: str):
+        if collection not in self._by_id:
+            self._keys[collection] = []
+            self._documents[collection] = []
+            self._by_id[collection] = {}
+        return self._keys[collection], self._documents[collection], self._by_id[collection]
+
+    def _add(self, collection: str, document: dict) -> None:
+        keys, documents, by_id = self._collection(collection)
+        if document['id'] in by_id:
+            raise ValueError(f"Duplicate id: {document['id']}")
+        document = copy_document(document)
+        if isinstance(document.get('timestamp'), datetime):
+            document['timestamp'] = utc_naive(document['timestamp'])
+        key = (document.get('timestamp') or datetime.min, document['id'])
+        position = bisect.bisect_right(keys, key)
+        keys.insert(position, key)
+        documents.insert(position, document)
+        by_id[document['id']] = document
+        if collection in self._text_indexes:
+            self._text_indexes[collection].add(document)
+
+    async def insert(self, collection: str, document: dict) -> None:
+        self._add(collection, document)
+
+    async def insert_many(self, collection: str, documents: List[dict]) -> InsertErrors:
+        errors = []
+        for index, document in enumerate(documents):
+            try:
+                self._add(collection, document)
+            except ValueError as e:
+                errors.append((index, str(e)))
+        return errors
+
+    async def insert_if_absent(self, collection: str, document: dict) -> bool:
+        if document['id'] in self._collection(collection)[2]:
+            return False
+        self._add(collection, document)
+        return True
+
+    async def find_page(self, collection: str, query: Query, limit: int) -> List[dict]:
+        keys, documents, _ = self._collection(collection)
+        # Walk backwards (newest first) from the upper bound set by `until` or the cursor
+        end = len(keys)
+        if query.until is not None:
+            end = bisect.bisect_left(keys, (utc_naive(query.until), ''))
+        if query.after is not None:
+            after = (utc_naive(query.after[0]), query.after[1])
+            end = min(end, bisect.bisect_left(keys, after))
+        since = utc_naive(query.since) if query.since is not None else None
+        page = []
+        for position in range(end - 1, -1, -1):
+            if since is not None and keys[position][0] < since:
+                break
+            document = documents[position]
+            if all(get_path(document, name) == value for name, value in query.equals.items()):
+                page.append(copy_document(document))
+                if len(page) >= limit:
+                    break
+        return page
+
+    async def find_in(self, collection: str, ids: Sequence[str]) -> List[dict]:
+        by_id = self._collection(collection)[2]
+        return [copy_document(by_id[id]) for id in ids if id in by_id]
+
+    async def update_fields(self, collection: str, updates: List[FieldUpdate]) -> None:
+        by_id = self._collection(collection)[2]
+        for id, set_fields, unset_fields in updates:
+            document = by_id.get(id)
+            if document is None:
+                continue
+            document.update(copy_document(set_fields))
+            for name in unset_fields:
+                document.pop(name, None)
+            if collection in self._text_indexes:
+                self._text_indexes[collection].add(document)
+
+    async def increment(self, collection: str, updates: List[Increment]) -> None:
+        by_id = self._collection(collection)[2]
+        for update in updates:
+            document = by_id.get(update.id)
+            if document is None:
+                self._add(collection, {name: _naive(value) for name, value in update.created().items()})
+            else:
+                apply_increment(document, update)
+
+    def _before(self, collection: str, cutoff: datetime) -> Tuple[int, int]:
+        """Positions of the documents with a timestamp before `cutoff`"""
+        keys = self._collection(collection)[0]
+        # Documents without a timestamp sort first as datetime.min; they are never included
+        start = bisect.bisect_left(keys, (datetime.min, '\uffff'))
+        return start, max(start, bisect.bisect_left(keys, (utc_naive(cutoff), '')))
+
+    def _remove(self, collection: str, start: int, end: int) -> List[dict]:
+        keys, documents, by_id = self._collection(collection)
+        removed = documents[start:end]
+        text_index = self._text_indexes.get(collection)
+        for document in removed:
+            del by_id[document['id']]
+            if text_index is not None:
+                text_index.remove(document['id'])
+        del keys[start:end]
+        del documents[start:end]
+        return removed
+
+    async def delete_before(self, collection: str, cutoff: datetime) -> int:
+        return len(self._remove(collection, *self._before(collection, cutoff)))
+
+    async def move_before(self, source: str, destination: str, cutoff: datetime, limit: int) -> int:
+        start, end = self._before(source, cutoff)
+        existing = self._collection(destination)[2]
+        moved = self._remove(source, start, min(end, start + limit))
+        for document in moved:
+            if document['id'] not in existing:
+                self._add(destination, document)
+        return len(moved)
+
+    async def ensure_text_index(self, collection: str, fields: Dict[str, float]) -> None:
+        from text_index import InvertedIndex
+
+        index = self._text_indexes.get(collection)
+        if index is not None and index.fields == fields:
+            return
+        index = InvertedIndex(fields)
+        for document in self._collection(collection)[1]:
+            index.add(document)
+        self._text_indexes[collection] = index
+
+    async def search(self, collection: str, text: str, query: Query, limit: int, offset: int = 0) -> List[Tuple[float, dict]]:
+        by_id = self._collection(collection)[2]
+        since = utc_naive(query.since) if query.since is not None else None
+        until = utc_naive(query.until) if query.until is not None else None
+
+        def accept(id: str) -> bool:
+            document = by_id[id]
+            timestamp = document.get('timestamp')
+            if since is not None and (timestamp is None or timestamp < since):
+                return False
+            if until is not None and (timestamp is None or timestamp >= until):
+                return False
+            return all(get_path(document, name) == value for name, value in query.equals.items())
+
+        filtered = query.equals or since is not None or until is not None
+        matches = self._text_indexes[collection].search(text, offset + limit, accept if filtered else None)
+        return [(score, copy_document(by_id[id])) for score, id in matches[offset:]]
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'$date': utc_naive(value).isoformat(timespec='microseconds')}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode(value: dict) -> Any:
+    if len(value) == 1 and '$date' in value:
+        return datetime.fromisoformat(value['$date'])
+    return value
+
+
+def _timestamp_text(value: Optional[datetime]) -> Optional[str]:
+    # Fixed-width ISO text sorts chronologically, so the (timestamp, id) index serves ordering
+    return utc_naive(value).isoformat(timespec='microseconds') if isinstance(value, datetime) else None
+
+
+class SQLiteStorage(Storage):
+    """Embedded SQLite file in WAL mode.
+
+    One table per collection with the document as JSON plus indexed id,
+    timestamp and mode columns. All writes go through a single writer thread,
+    and inserts that arrive while a write is in progress are committed together
+    in the next transaction. Reads use their own connection and thread, which
+    WAL lets run alongside the writer.
+    """
+
+    name = "sqlite"
+    COLUMNS = ('id', 'timestamp', 'mode')
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-writer')
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-reader')
+        self._write_conn: Optional[sqlite3.Connection] = None
+        self._read_conn: Optional[sqlite3.Connection] = None
+        self._tables = set()
+        self._pending: List[Tuple[str, dict, asyncio.Future]] = []
+        self._flushing = False
+        # The running group-commit flush, held so it isn't garbage collected mid-write
+        self._flush_task: Optional[asyncio.Task] = None
+        self._ttl: Dict[str, float] = {}
+        # collection -> searchable fields and weights, in FTS column order
+        self._text_fields: Dict[str, Dict[str, float]] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    async def _write(self, func, *args):
+        def run():
+            if self._write_conn is None:
+                self._write_conn = self._connect()
+            return func(self._write_conn, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._writer, run)
+
+    async def _read(self, func, *args):
+        def run():
+            if self._read_conn is None:
+                self._read_conn = self._connect()
+            return func(self._read_conn, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._reader, run)
+
+    def _table(self, conn: sqlite3.Connection, collection: str) -> str:
+        if not collection.isidentifier():
+            raise ValueError(f"Invalid collection name: {collection}")
+        if collection not in self._tables:
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {collection} '
+                '(id TEXT PRIMARY KEY, timestamp TEXT, mode TEXT, body TEXT NOT NULL)'
+            )
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {collection}_keyset ON {collection} (timestamp, id)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {collection}_mode ON {collection} (mode, timestamp, id)')
+            self._tables.add(collection)
+        return collection
+
+    @staticmethod
+    def _row(document: dict) -> tuple:
+        return (
+            document['id'],
+            _timestamp_text(document.get('timestamp')),
+            document.get('mode'),
+            json.dumps(document, default=_encode),
+        )
+
+    def _insert_rows(self, conn: sqlite3.Connection, collection: str, documents: List[dict]) -> InsertErrors:
+        table = self._table(conn, collection)
+        errors = []
+        conn.execute('BEGIN')
+        try:
+            for index, document in enumerate(documents):
+                try:
+                    conn.execute(f'INSERT INTO {table} VALUES (?, ?, ?, ?)', self._row(document))
+                except sqlite3.IntegrityError as e:
+                    errors.append((index, str(e)))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return errors
+
+    async def ensure_indexes(self) -> None:
+        def create(conn):
+            for collection in (
+                'prompts', 'prompts_archive', 'status_checks', 'prompt_templates', 'status_rollups', 'status_clients',
+                'usage_daily',
+            ):
+                self._table(conn, collection)
+        await self._write(create)
+
+    async def insert(self, collection: str, document: dict) -> None:
+        # Group commit: queue the row and let one flush write everything queued so far
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((collection, document, future))
+        if not self._flushing:
+            self._flushing = True
+            self._flush_task = asyncio.create_task(self._flush_pending())
+        await future
+
+    async def _flush_pending(self) -> None:
+        try:
+            while self._pending:
+                pending, self._pending = self._pending, []
+                by_collection: Dict[str, List[Tuple[dict, asyncio.Future]]] = {}
+                for collection, document, future in pending:
+                    by_collection.setdefault(collection, []).append((document, future))
+                for collection, items in by_collection.items():
+                    try:
+                        errors = dict(await self._write(self._insert_rows, collection, [doc for doc, _ in items]))
+                    except Exception as e:
+                        for _, future in items:
+                            if not future.done():
+                                future.set_exception(e)
+                        continue
+                    for index, (_, future) in enumerate(items):
+                        if future.done():
+                            continue
+                        if index in errors:
+                            future.set_exception(ValueError(errors[index]))
+                        else:
+                            future.set_result(None)
+        finally:
+            self._flushing = False
+
+    async def insert_many(self, collection: str, documents: List[dict]) -> InsertErrors:
+        return await self._write(self._insert_rows, collection, documents)
+
+    async def insert_if_absent(self, collection: str, document: dict) -> bool:
+        def run(conn):
+            table = self._table(conn, collection)
+            cursor = conn.execute(f'INSERT OR IGNORE INTO {table} VALUES (?, ?, ?, ?)', self._row(document))
+            return cursor.rowcount == 1
+        return await self._write(run)
+
+    def _where(self, query: Query) -> Tuple[str, list]:
+        clauses, params = [], []
+        for name, value in query.equals.items():
+            column = name if name in self.COLUMNS else f"json_extract(body, '$.{name}')"
+            clauses.append(f'{column} = ?')
+            params.append(value)
+        if query.since is not None:
+            clauses.append('timestamp >= ?')
+            params.append(_timestamp_text(query.since))
+        if query.until is not None:
+            clauses.append('timestamp < ?')
+            params.append(_timestamp_text(query.until))
+        if query.after is not None:
+            timestamp = _timestamp_text(query.after[0])
+            clauses.append('(timestamp < ? OR (timestamp = ? AND id < ?))')
+            params.extend([timestamp, timestamp, query.after[1]])
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    async def find_page(self, collection: str, query: Query, limit: int) -> List[dict]:
+        where, params = self._where(query)
+
+        def run(conn):
+            table = self._table(conn, collection)
+            rows = conn.execute(
+                f'SELECT body FROM {table}{where} ORDER BY timestamp DESC, id DESC LIMIT ?', (*params, limit)
+            ).fetchall()
+            return [json.loads(body, object_hook=_decode) for body, in rows]
+        return await self._read(run)
+
+    async def find_in(self, collection: str, ids: Sequence[str]) -> List[dict]:
+        ids = list(ids)
+        if not ids:
+            return []
+
+        def run(conn):
+            table = self._table(conn, collection)
+            rows = []
+            # Stay under SQLite's limit on bound parameters per statement
+            for start in range(0, len(ids), 900):
+                chunk = ids[start:start + 900]
+                placeholders = ', '.join('?' * len(chunk))
+                rows += conn.execute(f'SELECT body FROM {table} WHERE id IN ({placeholders})', chunk).fetchall()
+            return [json.loads(body, object_hook=_decode) for body, in rows]
+        return await self._read(run)
+
+    async def update_fields(self, collection: str, updates: List[FieldUpdate]) -> None:
+        def run(conn):
+            table = self._table(conn, collection)
+            conn.execute('BEGIN')
+            try:
+                for id, set_fields, unset_fields in updates:
+                    row = conn.execute(f'SELECT body FROM {table} WHERE id = ?', (id,)).fetchone()
+                    if row is None:
+                        continue
+                    document = json.loads(row[0], object_hook=_decode)
+                    document.update(set_fields)
+                    for name in unset_fields:
+                        document.pop(name, None)
+                    conn.execute(
+                        f'UPDATE {table} SET timestamp = ?, mode = ?, body = ? WHERE id = ?',
+                        (*self._row(document)[1:], id),
+                    )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        await self._write(run)
+
+    async def increment(self, collection: str, updates: List[Increment]) -> None:
+        # Read-modify-write is atomic here because every write runs on the single writer thread
+        def run(conn):
+            table = self._table(conn, collection)
+            conn.execute('BEGIN')
+            try:
+                for update in updates:
+                    row = conn.execute(f'SELECT body FROM {table} WHERE id = ?', (update.id,)).fetchone()
+                    if row is None:
+                        document = update.created()
+                    else:
+                        document = json.loads(row[0], object_hook=_decode)
+                        apply_increment(document, update)
+                    conn.execute(f'INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?)', self._row(document))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        await self._write(run)
+
+    async def delete_before(self, collection: str, cutoff: datetime) -> int:
+        def run(conn):
+            table = self._table(conn, collection)
+            return conn.execute(f'DELETE FROM {table} WHERE timestamp < ?', (_timestamp_text(cutoff),)).rowcount
+        return await self._write(run)
+
+    async def move_before(self, source: str, destination: str, cutoff: datetime, limit: int) -> int:
+        def run(conn):
+            table = self._table(conn, source)
+            target = self._table(conn, destination)
+            oldest = f'SELECT id FROM {table} WHERE timestamp < ? ORDER BY timestamp, id LIMIT ?'
+            params = (_timestamp_text(cutoff), limit)
+            # One transaction, so readers see each document in exactly one of the two tables
+            conn.execute('BEGIN')
+            try:
+                conn.execute(f'INSERT OR IGNORE INTO {target} SELECT * FROM {table} WHERE id IN ({oldest})', params)
+                moved = conn.execute(f'DELETE FROM {table} WHERE id IN ({oldest})', params).rowcount
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            return moved
+        return await self._write(run)
+
+    async def ensure_text_index(self, collection: str, fields: Dict[str, float]) -> None:
+        # An FTS5 table kept in step with the collection by triggers, so every write path updates it
+        columns = [name.replace('.', '_') for name in fields]
+        if not all(column.isidentifier() for column in columns):
+            raise ValueError(f"Invalid text index fields: {list(fields)}")
+        values = ', '.join(f"json_extract({{row}}.body, '$.{name}')" for name in fields)
+
+        def run(conn):
+            table = self._table(conn, collection)
+            fts = f'{table}_fts'
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts,)).fetchone()
+            if exists:
+                existing = [row[1] for row in conn.execute(f'PRAGMA table_info({fts})')]
+                if existing == columns:
+                    return
+            conn.execute('BEGIN')
+            try:
+                for name in (f'{fts}_insert', f'{fts}_delete', f'{fts}_update'):
+                    conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+                conn.execute(f'DROP TABLE IF EXISTS {fts}')
+                conn.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(columns)}, tokenize='porter unicode61')")
+                conn.execute(
+                    f'CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN '
+                    f'INSERT INTO {fts}(rowid, {", ".join(columns)}) VALUES (new.rowid, {values.format(row="new")}); END'
+                )
+                conn.execute(
+                    f'CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN '
+                    f'DELETE FROM {fts} WHERE rowid = old.rowid; END'
+                )
+                conn.execute(
+                    f'CREATE TRIGGER {fts}_update AFTER UPDATE ON {table} BEGIN '
+                    f'DELETE FROM {fts} WHERE rowid = old.rowid; '
+                    f'INSERT INTO {fts}(rowid, {", ".join(columns)}) VALUES (new.rowid, {values.format(row="new")}); END'
+                )
+                # Index what was written before the text index existed
+                conn.execute(
+                    f'INSERT INTO {fts}(rowid, {", ".join(columns)}) '
+                    f'SELECT rowid, {values.format(row=table)} FROM {table}'
+                )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        await self._write(run)
+        self._text_fields[collection] = dict(fields)
+
+    async def search(self, collection: str, text: str, query: Query, limit: int, offset: int = 0) -> List[Tuple[float, dict]]:
+        from text_index import tokenize
+
+        terms = tokenize(text)
+        if not terms:
+            return []
+        # Quoted terms so user input can't use FTS query syntax; any term may match, like MongoDB $text
+        match = ' OR '.join('"' + term.replace('"', '""') + '"' for term in terms)
+        weights = ', '.join(str(float(weight)) for weight in self._text_fields[collection].values())
+        where, params = self._where(Query(query.equals, query.since, query.until))
+        where = where.replace(' WHERE ', ' AND ', 1)
+
+        def run(conn):
+            table = self._table(conn, collection)
+            rows = conn.execute(
+                f'SELECT bm25({table}_fts, {weights}) AS relevance, {table}.body FROM {table}_fts '
+                f'JOIN {table} ON {table}.rowid = {table}_fts.rowid '
+                f'WHERE {table}_fts MATCH ?{where} '
+                f'ORDER BY relevance, {table}.timestamp DESC, {table}.id DESC LIMIT ? OFFSET ?',
+                (match, *params, limit, offset),
+            ).fetchall()
+            # bm25 is lower-is-better; flip it so every backend reports higher-is-better scores
+            return [(-relevance, json.loads(body, object_hook=_decode)) for relevance, body in rows]
+        return await self._read(run)
+
+    async def close(self) -> None:
+        def close_write():
+            if self._write_conn is not None:
+                self._write_conn.close()
+                self._write_conn = None
+
+        def close_read():
+            if self._read_conn is not None:
+                self._read_conn.close()
+                self._read_conn = None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._writer, close_write)
+        await loop.run_in_executor(self._reader, close_read)
+
+
+def storage_from_env() -> Storage:
+    """Build the backend named by STORAGE_BACKEND (default: mongo)"""
+    backend = os.environ.get('STORAGE_BACKEND', 'mongo').lower()
+    if backend == 'mongo':
+        return MotorStorage(os.environ.get('MONGO_URL'), os.environ.get('DB_NAME'))
+    if backend == 'sqlite':
+        return SQLiteStorage(os.environ.get('SQLITE_PATH', 'bizbuddy.db'))
+    if backend == 'memory':
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,108 @@
+"""In-process inverted index for backends without native full-text search.
+
+Each indexed field has a weight. A document's postings record the weighted
+count of each term across its fields, and a query scores documents with a
+BM25-style sum over the query terms, so rare terms count for more than common
+ones. The index is updated as documents are added or removed and never scans
+the collection to answer a query.
+"""
+import heapq
+import math
+import re
+from typing import Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+from storage import get_path
+
+_TOKEN = re.compile(r'\w+')
+
+# Too common to help ranking; MongoDB's English text index drops these too
+STOPWORDS = frozenset(
+    'a an and are as at be but by for from has have in is it its of on or our that the their this to was were '
+    'will with you your'.split()
+)
+
+# BM25 parameters: term-frequency saturation and document-length normalization
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class InvertedIndex:
+    def __init__(self, fields: Mapping[str, float]):
+        self.fields = dict(fields)
+        # term -> {document id: BM25 term weight, length-normalized when the document was added}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        # document id -> (terms it was indexed under, weighted length)
+        self._documents: Dict[str, Tuple[Set[str], float]] = {}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, document: dict) -> None:
+        id = document['id']
+        if id in self._documents:
+            self.remove(id)
+        frequencies: Dict[str, float] = {}
+        for field, weight in self.fields.items():
+            value = get_path(document, field)
+            if isinstance(value, str):
+                for token in tokenize(value):
+                    frequencies[token] = frequencies.get(token, 0.0) + weight
+        length = sum(frequencies.values())
+        self._documents[id] = (set(frequencies), length)
+        self._total_length += length
+        # Normalizing against the average length as of now keeps queries to one multiply-add per
+        # posting; the average drifts slowly once the index holds more than a few documents
+        average_length = self._total_length / len(self._documents) or 1.0
+        for term, frequency in frequencies.items():
+            self._postings.setdefault(term, {})[id] = (
+                frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average_length))
+            )
+
+    def remove(self, id: str) -> None:
+        entry = self._documents.pop(id, None)
+        if entry is None:
+            return
+        terms, length = entry
+        for term in terms:
+            postings = self._postings[term]
+            del postings[id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= length
+
+    def search(
+        self, text: str, limit: int, accept: Optional[Callable[[str], bool]] = None
+    ) -> List[Tuple[float, str]]:
+        """Best `limit` (score, id) pairs matching any term of `text`, highest score first"""
+        count = len(self._documents)
+        weighted = []
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings:
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                weighted.append((idf, postings))
+        if not weighted:
+            return []
+        if len(weighted) == 1:
+            # One term: the idf is a common factor, so rank the postings as they are
+            idf, scores = weighted[0]
+        else:
+            idf, scores = 1.0, {}
+            for term_idf, postings in weighted:
+                for id, weight in postings.items():
+                    scores[id] = scores.get(id, 0.0) + term_idf * weight
+        key = lambda item: (item[1], item[0])
+        if accept is None:
+            best = heapq.nlargest(limit, scores.items(), key=key)
+        else:
+            # Check filters on the best candidates first; only sort everything if too few pass
+            best = [item for item in heapq.nlargest(limit * 4, scores.items(), key=key) if accept(item[0])]
+            if len(best) < limit and len(scores) > limit * 4:
+                best = [item for item in sorted(scores.items(), key=key, reverse=True) if accept(item[0])]
+            best = best[:limit]
+        return [(score * idf, id) for id, score in best]
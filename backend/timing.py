@@ -0,0 +1,192 @@
+"""Per-request stage timing, reported as a Server-Timing header and a slow-request log.
+
+A sampled request carries a `RequestTiming` in a context variable. Code on
+the request path adds the time it spends to named stages with `add_stage`
+(storage calls add to `db`, rendering to `render`), and `TimedRoute` adds
+`validate` (reading and validating the body) and `serialize` (turning the
+handler's return value into a response). `TimingMiddleware` sends the stages
+as Server-Timing and keeps the slowest requests in a `SlowRequestLog`.
+
+Requests that aren't sampled pay for one random draw, and `add_stage` is a
+context variable lookup when no timing is active. A sampled request costs
+tens of microseconds, so production should sample a small fraction.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+
+
+class RequestTiming:
+    __slots__ = ('stages', 'details', 'route_started', 'endpoint_started', 'endpoint_finished')
+
+    def __init__(self):
+        # Stage name -> seconds, summed over every call in the stage
+        self.stages: Dict[str, float] = {}
+        # Extra fields for the slow-request log, e.g. the prompt mode
+        self.details: Dict[str, Any] = {}
+        self.route_started = self.endpoint_started = self.endpoint_finished = 0.0
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self, total: float) -> bytes:
+        entries = [f'{name};dur={seconds * 1000:.3f}' for name, seconds in self.stages.items()]
+        entries.append(f'total;dur={total * 1000:.3f}')
+        return ', '.join(entries).encode('latin-1')
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar('request_timing', default=None)
+
+
+def add_stage(stage: str, seconds: float) -> None:
+    """Add `seconds` to `stage` of the current request, if it is being timed"""
+    timing = _current.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+def annotate(**details) -> None:
+    """Attach fields to the current request's slow-log entry, if it is being timed"""
+    timing = _current.get()
+    if timing is not None:
+        timing.details.update(details)
+
+
+@contextmanager
+def stage(name: str):
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+
+class TimedRoute(APIRoute):
+    """APIRoute recording `validate` (until the endpoint runs) and `serialize` (after it returns)"""
+
+    def get_route_handler(self) -> Callable:
+        endpoint = self.dependant.call
+        if asyncio.iscoroutinefunction(endpoint):
+            async def timed_endpoint(*args, **kwargs):
+                timing = _current.get()
+                if timing is None:
+                    return await endpoint(*args, **kwargs)
+                timing.endpoint_started = time.perf_counter()
+                timing.add('validate', timing.endpoint_started - timing.route_started)
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    timing.endpoint_finished = time.perf_counter()
+
+            # FastAPI has already read the endpoint's signature; only the call is swapped
+            self.dependant.call = timed_endpoint
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timing = _current.get()
+            if timing is None:
+                return await handler(request)
+            timing.route_started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                finished = time.perf_counter()
+                if not timing.endpoint_started:
+                    # Rejected while reading or validating the request
+                    timing.add('validate', finished - timing.route_started)
+                elif timing.endpoint_finished:
+                    timing.add('serialize', finished - timing.endpoint_finished)
+
+        return timed_handler
+
+
+class SlowRequestLog:
+    """The `capacity` slowest sampled requests since the process started"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.sampled = 0
+        # (duration, sequence, entry); the fastest retained request is at the top
+        self._heap: List[tuple] = []
+        self._sequence = itertools.count()
+
+    def add(self, duration: float, entry: Callable[[], dict]) -> None:
+        """Keep the request if it is among the slowest; `entry` builds its record only then"""
+        self.sampled += 1
+        if self.capacity <= 0:
+            return
+        if len(self._heap) < self.capacity:
+            heapq.heappush(self._heap, (duration, next(self._sequence), entry()))
+        elif duration > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (duration, next(self._sequence), entry()))
+
+    def entries(self) -> List[dict]:
+        return [entry for _, _, entry in sorted(self._heap, key=lambda item: item[0], reverse=True)]
+
+
+class TimingMiddleware:
+    """Pure ASGI middleware timing a `sample_rate` fraction of HTTP requests"""
+
+    def __init__(self, app, log: SlowRequestLog, sample_rate: float, header: bool = True):
+        self.app = app
+        self.log = log
+        self.sample_rate = sample_rate
+        self.header = header
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or self.sample_rate <= 0 or (
+                self.sample_rate < 1 and random.random() >= self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        start = time.perf_counter()
+        received = 0
+        status = 500
+
+        async def receive_wrapper():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                if self.header:
+                    header = (b'server-timing', timing.header(time.perf_counter() - start))
+                    message = {**message, 'headers': [*message.get('headers', ()), header]}
+            await send(message)
+
+        token = _current.set(timing)
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            _current.reset(token)
+            duration = time.perf_counter() - start
+            route = scope.get('route')
+            self.log.add(duration, lambda: {
+                'timestamp': datetime.now(timezone.utc),
+                'method': scope['method'],
+                'path': scope['path'],
+                'route': getattr(route, 'path', None),
+                'status': status,
+                'request_bytes': received,
+                'duration_ms': round(duration * 1000, 3),
+                'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in timing.stages.items()},
+                **timing.details,
+            })
@@ -0,0 +1,64 @@
+"""Daily usage counters for generated prompts.
+
+Every stored prompt bumps one counter document per dimension in
+`usage_daily`, keyed by (day, dimension, value), so "how did generation split
+by channel last month" reads one document per day and value instead of
+scanning the prompts collection. Counts are by the day a prompt was
+generated; archiving or expiring prompts doesn't change them.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from storage import Increment, get_path, utc_naive
+
+# Dimension -> where its value lives in a prompt document
+DIMENSIONS = {
+    'mode': 'mode',
+    'channel': 'request_data.channel',
+    'market': 'request_data.market',
+    'language': 'request_data.language',
+}
+
+# Free-text values are trimmed and capped so one odd brief can't make a huge counter id
+MAX_VALUE_LENGTH = 200
+
+
+def day_start(timestamp: datetime) -> datetime:
+    return utc_naive(timestamp).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def recent_days(now: datetime, count: int) -> List[datetime]:
+    """Start times of the last `count` days, oldest first, ending with today"""
+    today = day_start(now)
+    return [today - timedelta(days=offset) for offset in range(count - 1, -1, -1)]
+
+
+def usage_value(document: dict, dimension: str) -> Optional[str]:
+    value = get_path(document, DIMENSIONS[dimension])
+    if value is None:
+        return None
+    return str(value).strip()[:MAX_VALUE_LENGTH]
+
+
+def usage_id(day: datetime, dimension: str, value: str) -> str:
+    return f"{day.date().isoformat()}:{dimension}:{value}"
+
+
+def usage_increments(documents: Iterable[dict]) -> List[Increment]:
+    """One counter update per (day, dimension, value) across `documents`, however many share it"""
+    counts = Counter()
+    for document in documents:
+        day = day_start(document['timestamp'])
+        for dimension in DIMENSIONS:
+            value = usage_value(document, dimension)
+            if value is not None:
+                counts[(day, dimension, value)] += 1
+    return [
+        Increment(
+            id=usage_id(day, dimension, value),
+            on_insert={'timestamp': day, 'dimension': dimension, 'value': value},
+            inc={'count': count},
+        )
+        for (day, dimension, value), count in counts.items()
+    ]
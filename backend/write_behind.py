@@ -0,0 +1,199 @@
+"""Write-behind persistence for generated prompts.
+
+Request handlers enqueue documents and return immediately; a background task
+drains the bounded queue and writes documents in bulk once `flush_size`
+documents are waiting or `flush_interval` seconds have passed since the first
+one arrived. When the queue is full, `put` waits up to `put_timeout` seconds
+for space before raising `WriteBehindFull`, so a slow database pushes back on
+callers instead of growing memory without bound.
+
+Callers have already been answered, so a flush that raises is retried with
+exponential backoff (capped at `max_retry_backoff`) until it succeeds, and no
+new documents are taken off the queue meanwhile: during an outage the queue
+fills and `put` pushes back. Documents are only dropped by `close`, which
+gives up on a batch after `close_retries` more tries. `flush` returns how many
+documents it could not store (e.g. duplicate ids); those are counted as
+failed and not retried.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindFull(Exception):
+    """Raised when the queue stays full for longer than the put timeout"""
+
+
+class WriteBehindQueue:
+    def __init__(
+        self,
+        flush: Callable[[List[dict]], Awaitable[int]],
+        max_size: int = 10000,
+        flush_size: int = 500,
+        flush_interval: float = 0.05,
+        put_timeout: float = 1.0,
+        retry_backoff: float = 0.1,
+        max_retry_backoff: float = 5.0,
+        close_retries: int = 3,
+    ):
+        self._flush = flush
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.close_retries = close_retries
+        # Set by close: a retrying batch stops waiting and gets close_retries more tries
+        self._closing: Optional[asyncio.Event] = None
+        self._close_retries = close_retries
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._writing: Optional[asyncio.Future] = None
+        self._collecting: List[dict] = []
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.failed = 0
+        self.retries = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self) -> None:
+        """Start the background flusher on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, document: dict) -> None:
+        if not self.running:
+            raise RuntimeError("Write-behind queue is not running")
+        try:
+            self._queue.put_nowait(document)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(document), self.put_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise WriteBehindFull(f"Write-behind queue full ({self.max_size} documents)")
+        self.enqueued += 1
+
+    async def close(self) -> None:
+        """Stop the flusher and write out everything still queued"""
+        if self._task is None:
+            return
+        self._close_retries = self.close_retries
+        self._closing.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # A flush interrupted by the cancel keeps running under shield; let it finish
+        if self._writing is not None:
+            await self._writing
+        await self._write(self._collecting)
+        self._collecting = []
+        while not self._queue.empty():
+            await self._write(self._drain(self.flush_size))
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "depth": self.depth,
+            "max_size": self.max_size,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_flush_seconds * 1000,
+            "max_flush_ms": self.max_flush_seconds * 1000,
+            "avg_flush_ms": self.total_flush_seconds * 1000 / self.flushes if self.flushes else 0.0,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Kept on self so documents taken off the queue survive a cancel mid-collection
+            self._collecting = batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.flush_size:
+                batch.extend(self._drain(self.flush_size - len(batch)))
+                timeout = deadline - loop.time()
+                if len(batch) >= self.flush_size or timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._collecting = []
+            self._writing = asyncio.ensure_future(self._write(batch))
+            await asyncio.shield(self._writing)
+            self._writing = None
+
+    def _drain(self, limit: int) -> List[dict]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _write(self, batch: List[dict]) -> None:
+        """Flush `batch`, retrying until it is stored; once closing, give up after close_retries tries"""
+        if not batch:
+            return
+        start = time.perf_counter()
+        attempt = closing_attempt = 0
+        while True:
+            try:
+                failed = await self._flush(batch)
+            except Exception:
+                if self._closing.is_set():
+                    if closing_attempt >= self._close_retries:
+                        logger.exception("Dropped %d write-behind documents on close", len(batch))
+                        self.failed += len(batch)
+                        # The database is down; backing off on every remaining batch would outlast the shutdown
+                        self._close_retries = 0
+                        break
+                    closing_attempt += 1
+                    delay = self.retry_backoff * 2 ** (closing_attempt - 1)
+                else:
+                    attempt += 1
+                    delay = self.retry_backoff * 2 ** (attempt - 1)
+                delay = min(delay, self.max_retry_backoff)
+                self.retries += 1
+                logger.warning("Write-behind flush of %d documents failed; retrying in %.2fs", len(batch), delay)
+                if self._closing.is_set():
+                    await asyncio.sleep(delay)
+                else:
+                    try:
+                        # Cut short by close, which bounds the remaining tries
+                        await asyncio.wait_for(self._closing.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                continue
+            self.flushed += len(batch) - failed
+            self.failed += failed
+            break
+        elapsed = time.perf_counter() - start
+        self.flushes += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
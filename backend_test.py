@@ -126,7 +126,7 @@ class BizBuddyAPITester:
             
             if success:
                 data = response.json()
-                details += f", Found {len(data)} prompts"
+                details += f", Found {len(data['items'])} prompts"
                 
             self.log_test("Get All Prompts", success, details)
             return success
@@ -166,7 +166,7 @@ class BizBuddyAPITester:
             
             if success:
                 data = response.json()
-                details += f", Found {len(data)} status checks"
+                details += f", Found {len(data['items'])} status checks"
                 
             self.log_test("Get Status Checks", success, details)
             
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+# The backend is a directory of flat modules run from backend/, not an installed package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from storage import MemoryStorage, SQLiteStorage  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+async def storage(request, tmp_path):
+    """Each backend that runs without a server; MongoDB is covered by the same contract but needs one"""
+    backend = MemoryStorage() if request.param == 'memory' else SQLiteStorage(str(tmp_path / 'bizbuddy.db'))
+    await backend.ensure_indexes()
+    yield backend
+    await backend.close()
+
+
+@pytest.fixture
+async def api(monkeypatch):
+    """Client for the API app on a fresh MemoryStorage (available as server.storage); startup hooks don't run"""
+    import httpx
+    import server
+
+    backend = MemoryStorage()
+    await backend.ensure_indexes()
+    monkeypatch.setattr(server, 'storage', backend)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url='http://test') as client:
+        yield client
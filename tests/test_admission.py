@@ -0,0 +1,157 @@
+import asyncio
+
+import httpx
+import pytest
+
+import admission
+from admission import AdmissionMiddleware, ConcurrencyLimiter, Overloaded, TokenBuckets
+from metrics import Counter
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, 'monotonic', clock)
+    return clock
+
+
+def test_token_bucket_allows_burst_then_refills(clock):
+    buckets = TokenBuckets(rate=2, burst=3)
+    assert [buckets.take('a') for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('a') == pytest.approx(0.5)
+    # Other keys have their own bucket
+    assert buckets.take('b') == 0
+    clock.now += 0.5
+    assert buckets.take('a') == 0
+    assert buckets.take('a') == pytest.approx(0.5)
+    # Refill stops at the burst size
+    clock.now += 60
+    assert [buckets.take('a') for _ in range(4)][-1] > 0
+
+
+def test_token_buckets_forget_least_recently_seen_keys(clock):
+    buckets = TokenBuckets(rate=1, burst=1, max_keys=2)
+    for key in ('a', 'b', 'a', 'c'):
+        buckets.take(key)
+    assert len(buckets) == 2
+    # 'b' was forgotten, so it starts with a full bucket again
+    assert buckets.take('b') == 0
+
+
+async def test_release_hands_the_slot_to_the_first_waiter():
+    limiter = ConcurrencyLimiter(limit=1, max_queue=2, timeout=5)
+    assert await limiter.acquire() is False
+    first = asyncio.ensure_future(limiter.acquire())
+    second = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    assert (limiter.in_flight, limiter.queued) == (1, 2)
+
+    limiter.release()
+    assert await asyncio.wait_for(first, 1) is True
+    assert not second.done()
+    assert (limiter.in_flight, limiter.queued) == (1, 1)
+    limiter.release()
+    assert await asyncio.wait_for(second, 1) is True
+    limiter.release()
+    assert (limiter.in_flight, limiter.queued) == (0, 0)
+
+
+async def test_queue_full_and_queue_timeout_are_distinct_reasons():
+    limiter = ConcurrencyLimiter(limit=1, max_queue=1, timeout=0.02)
+    await limiter.acquire()
+    waiter = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    with pytest.raises(Overloaded) as full:
+        await limiter.acquire()
+    assert full.value.reason == 'queue_full'
+    with pytest.raises(Overloaded) as timed_out:
+        await waiter
+    assert timed_out.value.reason == 'queue_timeout'
+    assert (limiter.in_flight, limiter.queued) == (1, 0)
+    limiter.release()
+    assert limiter.in_flight == 0
+
+
+async def test_cancelled_waiter_gives_up_its_place():
+    limiter = ConcurrencyLimiter(limit=1, max_queue=2, timeout=5)
+    await limiter.acquire()
+    waiter = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.queued == 0
+    limiter.release()
+    assert (limiter.in_flight, limiter.queued) == (0, 0)
+
+
+async def test_waiter_cancelled_after_being_granted_passes_the_slot_on():
+    limiter = ConcurrencyLimiter(limit=1, max_queue=2, timeout=5)
+    await limiter.acquire()
+    granted = asyncio.ensure_future(limiter.acquire())
+    next_in_line = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    # The slot is handed over, then the waiter is cancelled before it resumes
+    limiter.release()
+    granted.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await granted
+    assert await asyncio.wait_for(next_in_line, 1) is True
+    limiter.release()
+    assert (limiter.in_flight, limiter.queued) == (0, 0)
+
+
+def admission_app(buckets, limiter, outcomes, gate: asyncio.Event = None):
+    async def app(scope, receive, send):
+        if gate is not None:
+            await gate.wait()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+    middleware = AdmissionMiddleware(app, buckets, limiter, outcomes, key_header='X-API-Key')
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url='http://test')
+
+
+def outcome_counts(outcomes: Counter) -> dict:
+    return {labels[0]: count for labels, count in outcomes.values.items()}
+
+
+async def test_rate_limited_client_gets_429_with_retry_after(clock):
+    outcomes = Counter('outcomes', '', ('outcome',))
+    async with admission_app(TokenBuckets(rate=0.25, burst=1), ConcurrencyLimiter(0, 0, 0), outcomes) as client:
+        assert (await client.post('/api/generate-prompt', headers={'X-API-Key': 'a'})).status_code == 200
+        response = await client.post('/api/generate-prompt', headers={'X-API-Key': 'a'})
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '4'
+        # Keyed by the header, so another key isn't limited; other paths aren't checked at all
+        assert (await client.post('/api/generate-prompt', headers={'X-API-Key': 'b'})).status_code == 200
+        assert (await client.get('/api/prompts', headers={'X-API-Key': 'a'})).status_code == 200
+    assert outcome_counts(outcomes) == {'admitted': 2, 'rate_limited': 1}
+
+
+async def test_busy_server_answers_503_with_retry_after():
+    outcomes = Counter('outcomes', '', ('outcome',))
+    limiter = ConcurrencyLimiter(limit=1, max_queue=1, timeout=2.5)
+    gate = asyncio.Event()
+    async with admission_app(TokenBuckets(0, 0), limiter, outcomes, gate) as client:
+        running = asyncio.ensure_future(client.post('/api/generate-prompt'))
+        queued = asyncio.ensure_future(client.post('/api/generate-prompt'))
+        while limiter.queued < 1:
+            await asyncio.sleep(0.001)
+        rejected = await client.post('/api/generate-prompt')
+        assert rejected.status_code == 503
+        assert rejected.headers['Retry-After'] == '3'
+        gate.set()
+        assert [(await running).status_code, (await queued).status_code] == [200, 200]
+    assert outcome_counts(outcomes) == {'admitted': 2, 'queued': 1, 'queue_full': 1}
+    assert (limiter.in_flight, limiter.queued) == (0, 0)
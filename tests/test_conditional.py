@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+import server
+from benchmarks.common import sample_payload
+
+pytestmark = pytest.mark.anyio
+
+LISTINGS = {'/api/prompts': 'prompts', '/api/status': 'status_checks'}
+
+
+def count_reads(monkeypatch) -> list:
+    reads = []
+    find_page = server.storage.find_page
+
+    async def counted(collection, query, limit):
+        reads.append(collection)
+        return await find_page(collection, query, limit)
+    monkeypatch.setattr(server.storage, 'find_page', counted)
+    return reads
+
+
+async def write(api, path: str) -> None:
+    if path == '/api/prompts':
+        response = await api.post('/api/generate-prompt', json=sample_payload('headlines'))
+    else:
+        response = await api.post('/api/status', json={'client_name': 'probe'})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('path', LISTINGS)
+async def test_matching_etag_is_answered_without_reading_storage(api, monkeypatch, path):
+    await write(api, path)
+    first = await api.get(path)
+    assert first.status_code == 200
+    assert first.headers['ETag'].startswith('W/"')
+
+    reads = count_reads(monkeypatch)
+    cached = await api.get(path, headers={'If-None-Match': first.headers['ETag']})
+    assert cached.status_code == 304
+    assert cached.content == b''
+    assert cached.headers['ETag'] == first.headers['ETag']
+    assert reads == []
+    # Any of several tags, and the strong form of a weak tag, match too
+    strong = first.headers['ETag'].removeprefix('W/')
+    assert (await api.get(path, headers={'If-None-Match': f'"other", {strong}'})).status_code == 304
+    assert (await api.get(path, headers={'If-None-Match': '"other"'})).status_code == 200
+
+
+@pytest.mark.parametrize('path', LISTINGS)
+async def test_write_changes_the_etag(api, path):
+    etag = (await api.get(path)).headers['ETag']
+    await write(api, path)
+    response = await api.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+async def test_query_string_is_part_of_the_etag(api):
+    etag = (await api.get('/api/prompts?limit=5')).headers['ETag']
+    assert (await api.get('/api/prompts?limit=5', headers={'If-None-Match': etag})).status_code == 304
+    response = await api.get('/api/prompts?limit=6', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+async def test_ttl_purge_changes_the_status_etag(api, monkeypatch):
+    await server.storage.ensure_ttl('status_checks', 60)
+    await server.storage.insert('status_checks', {
+        'id': 'old', 'client_name': 'probe', 'timestamp': datetime.now(timezone.utc) - timedelta(hours=1),
+    })
+    etag = (await api.get('/api/status')).headers['ETag']
+
+    await server.purge_expired()
+    response = await api.get('/api/status', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json()['items'] == []
+
+    # Nothing expired: the ETag stays valid
+    etag = response.headers['ETag']
+    await server.purge_expired()
+    assert (await api.get('/api/status', headers={'If-None-Match': etag})).status_code == 304
+
+    # A backend that expires documents itself (MongoDB) can't say whether any went
+    async def native_ttl():
+        return {'status_checks': None}
+    monkeypatch.setattr(server.storage, 'purge_expired', native_ttl)
+    await server.purge_expired()
+    assert (await api.get('/api/status', headers={'If-None-Match': etag})).status_code == 200
+
+
+async def test_if_modified_since(api, monkeypatch):
+    await write(api, '/api/status')
+    last_modified = (await api.get('/api/status')).headers['Last-Modified']
+    reads = count_reads(monkeypatch)
+    assert (await api.get('/api/status', headers={'If-Modified-Since': last_modified})).status_code == 304
+    assert reads == []
+
+    earlier = format_datetime(server.CHANGE_MARKERS['status_checks'].last_modified - timedelta(hours=1), usegmt=True)
+    assert (await api.get('/api/status', headers={'If-Modified-Since': earlier})).status_code == 200
+    assert (await api.get('/api/status', headers={'If-Modified-Since': 'not a date'})).status_code == 200
+    # If-None-Match takes precedence
+    both = {'If-Modified-Since': last_modified, 'If-None-Match': '"other"'}
+    assert (await api.get('/api/status', headers=both)).status_code == 200
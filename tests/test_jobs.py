@@ -0,0 +1,97 @@
+import io
+
+import pytest
+
+import server
+from jobs import UploadError, UploadTooLarge, read_rows, receive_upload
+
+BOUNDARY = 'bizbuddy-test-boundary'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+
+
+def rows(content: str, format: str) -> list:
+    return list(read_rows(io.BytesIO(content.encode('utf-8')), format))
+
+
+def multipart(*parts) -> bytes:
+    """A form-data body from (name, filename, content) parts"""
+    body = b''
+    for name, filename, content in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+        body += f'--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode() + content + b'\r\n'
+    return body + f'--{BOUNDARY}--\r\n'.encode()
+
+
+async def chunked(body: bytes, size: int = 7):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def test_csv_rows_skip_blank_cells_and_reject_extra_cells():
+    content = '\ufeffproduct,offer,constraints\r\nTea,,\r\nCoffee,"10%, today",x,extra\r\n"Multi\nline",Free,\r\n'
+    assert rows(content, 'csv') == [
+        (1, {'product': 'Tea'}, None),
+        (2, None, "Row has more cells than the header"),
+        (3, {'product': 'Multi\nline', 'offer': 'Free'}, None),
+    ]
+
+
+def test_csv_row_with_fewer_cells_leaves_the_rest_to_defaults():
+    assert rows('product,offer\nTea\n', 'csv') == [(1, {'product': 'Tea'}, None)]
+
+
+def test_ndjson_rows_report_bad_lines_and_carry_on():
+    content = '{"product": "Tea"}\n\nnot json\n[1, 2]\n{"product": "Coffee"}'
+    parsed = rows(content, 'ndjson')
+    assert parsed[0] == (1, {'product': 'Tea'}, None)
+    assert parsed[1][:2] == (3, None) and parsed[1][2].startswith("Invalid JSON")
+    assert parsed[2] == (4, None, "Expected a JSON object")
+    assert parsed[3] == (5, {'product': 'Coffee'}, None)
+
+
+def test_read_rows_leaves_the_file_open():
+    file = io.BytesIO(b'{"product": "Tea"}\n')
+    list(read_rows(file, 'ndjson'))
+    assert not file.closed
+
+
+@pytest.mark.anyio
+async def test_receive_upload_writes_only_the_file_part():
+    body = multipart(('note', None, b'ignored'), ('file', 'briefs.csv', b'product\nTea\n'), ('file', 'x.csv', b'second'))
+    destination = io.BytesIO()
+    assert await receive_upload(chunked(body), CONTENT_TYPE, destination) == ('briefs.csv', None, 12)
+    assert destination.getvalue() == b'product\nTea\n'
+
+
+@pytest.mark.anyio
+async def test_receive_upload_stops_past_max_bytes():
+    body = multipart(('file', 'briefs.csv', b'x' * 100))
+    destination = io.BytesIO()
+    with pytest.raises(UploadTooLarge):
+        await receive_upload(chunked(body), CONTENT_TYPE, destination, max_bytes=50)
+    assert len(destination.getvalue()) <= 50
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('content_type, body', [
+    (CONTENT_TYPE, multipart(('other', 'briefs.csv', b'product\nTea\n'))),
+    ('application/json', b'{}'),
+    ('multipart/form-data', b''),
+])
+async def test_receive_upload_rejects_uploads_without_a_file_part(content_type, body):
+    with pytest.raises(UploadError) as error:
+        await receive_upload(chunked(body), content_type, io.BytesIO())
+    assert not isinstance(error.value, UploadTooLarge)
+
+
+@pytest.mark.anyio
+async def test_upload_endpoint_status_codes(api, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, 'UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(server, 'MAX_UPLOAD_BYTES', 50)
+    headers = {'Content-Type': CONTENT_TYPE}
+    too_large = await api.post('/api/prompts/upload', content=multipart(('file', 'b.csv', b'x' * 100)), headers=headers)
+    assert too_large.status_code == 413
+    missing = await api.post('/api/prompts/upload', content=multipart(('other', 'b.csv', b'x')), headers=headers)
+    assert missing.status_code == 400
+    # Rejected uploads don't leave their temporary file behind
+    assert list(tmp_path.iterdir()) == []
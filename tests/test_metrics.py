@@ -0,0 +1,77 @@
+import pytest
+
+import metrics
+from metrics import Histogram, InstrumentedStorage
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class SlowStorage:
+    """A backend whose calls take `cost` seconds of the fake clock; stream fetches 2 documents per batch"""
+    name = 'fake'
+
+    def __init__(self, clock: Clock, cost: float = 0.5):
+        self.clock = clock
+        self.cost = cost
+
+    async def find_page(self, collection, query, limit):
+        self.clock.now += self.cost
+        return []
+
+    async def stream(self, collection, query, batch_size=2):
+        for batch in range(3):
+            self.clock.now += self.cost
+            for number in range(batch_size):
+                yield {'id': batch * batch_size + number}
+
+    def helper(self):
+        return 'plain'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(metrics.time, 'perf_counter', clock)
+    return clock
+
+
+def recorded(latency: Histogram) -> dict:
+    return {labels: (total, count) for labels, (_, total, count) in latency.values.items()}
+
+
+async def test_coroutine_methods_are_timed(clock):
+    latency = Histogram('latency', '', ('backend', 'operation', 'collection'))
+    storage = InstrumentedStorage(SlowStorage(clock), latency)
+    await storage.find_page('prompts', None, 10)
+    await storage.find_page('prompts', None, 10)
+    assert recorded(latency) == {('fake', 'find_page', 'prompts'): (1.0, 2)}
+    assert storage.helper() == 'plain'
+
+
+async def test_stream_is_timed_once_without_the_consumers_time(clock):
+    latency = Histogram('latency', '', ('backend', 'operation', 'collection'))
+    storage = InstrumentedStorage(SlowStorage(clock), latency)
+    ids = []
+    async for document in storage.stream('prompts', None):
+        ids.append(document['id'])
+        clock.now += 10  # the consumer's work
+        assert latency.values == {}
+    assert ids == list(range(6))
+    assert recorded(latency) == {('fake', 'stream', 'prompts'): (pytest.approx(1.5), 1)}
+
+
+async def test_stream_closed_early_is_still_recorded(clock):
+    latency = Histogram('latency', '', ('backend', 'operation', 'collection'))
+    storage = InstrumentedStorage(SlowStorage(clock), latency)
+    documents = storage.stream('prompts', None)
+    assert (await documents.__anext__())['id'] == 0
+    await documents.aclose()
+    assert recorded(latency) == {('fake', 'stream', 'prompts'): (pytest.approx(0.5), 1)}
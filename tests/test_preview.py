@@ -0,0 +1,121 @@
+import pytest
+from starlette.testclient import TestClient
+
+import server
+from benchmarks.common import sample_payload
+from server import PreviewError, PreviewSession, PromptRequest
+from storage import MemoryStorage
+
+
+def rendered(brief: dict) -> str:
+    return server.generate_prompt(PromptRequest(**brief))
+
+
+def apply(segments: list, message: dict) -> list:
+    if message['type'] == 'snapshot':
+        return list(message['segments'])
+    for index, text in message['segments']:
+        segments[index] = text
+    return segments
+
+
+def typing(brief: dict):
+    """(field, value so far) for typing new text into a few fields, character by character"""
+    for field, text in (('product', 'Oat milk {latte}'), ('offer', '2 for 1 {{ }}'), ('video_len', '15')):
+        for end in range(1, len(text) + 1):
+            yield field, text[:end]
+
+
+@pytest.mark.parametrize('mode', server.MASTER_PROMPTS)
+def test_patches_reproduce_the_full_render(mode):
+    session = PreviewSession()
+    brief = sample_payload(mode)
+    first = session.update(brief)
+    assert first['type'] == 'snapshot'
+    segments = apply([], first)
+    assert ''.join(segments) == rendered(brief)
+
+    for field, value in typing(brief):
+        brief[field] = value
+        message = session.update({field: value})
+        assert message['type'] == 'patch'
+        segments = apply(segments, message)
+        assert ''.join(segments) == rendered(brief)
+    assert session.render.text == rendered(brief)
+
+
+def test_unchanged_field_sends_an_empty_patch():
+    session = PreviewSession()
+    brief = sample_payload('headlines')
+    session.update(brief)
+    assert session.update({'product': brief['product']}) == {'type': 'patch', 'segments': []}
+
+
+def test_mode_change_sends_a_snapshot_of_the_new_template():
+    session = PreviewSession()
+    brief = sample_payload('headlines')
+    session.update(brief)
+    message = session.update({'mode': 'visual_ad'})
+    assert message['type'] == 'snapshot'
+    assert message['mode'] == 'visual_ad'
+    assert message['version'] == server.TEMPLATES.current['visual_ad']
+    assert ''.join(message['segments']) == rendered({**brief, 'mode': 'visual_ad'})
+
+
+@pytest.mark.parametrize('change', [
+    {'video_len': 'not a number'},
+    {'mode': 'no_such_mode'},
+    {'no_such_field': 'x'},
+    {'product': None},
+])
+def test_invalid_update_leaves_the_session_unchanged(change):
+    session = PreviewSession()
+    brief = sample_payload('visual_ad')
+    session.update(brief)
+    before = (dict(session.brief), session.request, session.version, list(session.render.segments))
+    with pytest.raises(PreviewError):
+        session.update(change)
+    assert (session.brief, session.request, session.version, session.render.segments) == before
+    # The next valid change patches from the last valid state
+    brief['offer'] = 'Free shipping'
+    segments = apply(list(before[3]), session.update({'offer': 'Free shipping'}))
+    assert ''.join(segments) == rendered(brief)
+
+
+@pytest.mark.anyio
+async def test_nothing_to_save_until_the_brief_validates():
+    session = PreviewSession()
+    with pytest.raises(PreviewError):
+        session.update({'mode': 'headlines'})
+    assert (session.brief, session.render) == ({}, None)
+    with pytest.raises(PreviewError):
+        await session.save()
+
+
+def test_websocket_previews_and_saves(monkeypatch):
+    backend = MemoryStorage()
+    monkeypatch.setattr(server, 'storage', backend)
+    monkeypatch.setattr(server, 'WRITE_BEHIND_ENABLED', False)
+    brief = sample_payload('short_ad_copy')
+    client = TestClient(server.app)
+    with client.websocket_connect('/api/preview') as websocket:
+        websocket.send_json({'type': 'update', 'fields': brief})
+        segments = apply([], websocket.receive_json())
+        websocket.send_json({'type': 'update', 'seq': 1, 'fields': {'offer': 'Half price'}})
+        patch = websocket.receive_json()
+        assert patch['seq'] == 1
+        segments = apply(segments, patch)
+        brief['offer'] = 'Half price'
+        assert ''.join(segments) == rendered(brief)
+
+        websocket.send_json({'type': 'update', 'fields': {'video_len': 'x'}})
+        assert websocket.receive_json()['type'] == 'error'
+
+        websocket.send_json({'type': 'save'})
+        saved = websocket.receive_json()
+    assert saved['type'] == 'saved'
+    assert saved['prompt']['generated_prompt'] == rendered(brief)
+    # Stored like any generated prompt, so it reads back as the text the preview showed
+    [document] = backend._documents['prompts']
+    assert document['id'] == saved['prompt']['id']
+    assert server.hydrate_prompt(document)['generated_prompt'] == rendered(brief)
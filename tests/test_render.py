@@ -0,0 +1,58 @@
+"""Precompiled and partially bound templates must render exactly what str.format on MASTER_PROMPTS renders"""
+import pytest
+
+import server
+from benchmarks.common import sample_payload
+
+BRIEFS = {
+    'sample': {},
+    'defaults': {'constraints': '', 'competitive_angle': '', 'references': '', 'asset_type': None, 'video_len': None},
+    # Placeholder syntax in a value is text, not another substitution
+    'braces': {'product': '{product} {{offer}} }{', 'offer': '100% off {0}', 'references': 'Ünïcode — “quotes”'},
+}
+
+
+@pytest.mark.parametrize('brief', BRIEFS)
+@pytest.mark.parametrize('mode', server.MASTER_PROMPTS)
+def test_compiled_render_matches_str_format(mode, brief):
+    request = server.PromptRequest(**sample_payload(mode, **BRIEFS[brief]))
+    expected = server.MASTER_PROMPTS[mode].format(**server.prompt_values(request))
+    assert server.TEMPLATES.current_template(mode).render(server.prompt_values(request)) == expected
+    assert server.generate_prompt(request) == expected
+
+
+# Field subsets left unbound: none, one, a few, all of them
+UNBOUND = [(), ('product',), ('offer', 'references', 'video_len', 'channel'), None]
+
+
+@pytest.mark.parametrize('unbound', UNBOUND)
+@pytest.mark.parametrize('brief', BRIEFS)
+@pytest.mark.parametrize('mode', server.MASTER_PROMPTS)
+def test_bound_template_renders_like_the_full_template(mode, brief, unbound):
+    values = server.prompt_values(server.PromptRequest(**sample_payload(mode, **BRIEFS[brief])))
+    unbound = set(values if unbound is None else unbound)
+    template = server.TEMPLATES.current_template(mode)
+    bound = template.bind({field: value for field, value in values.items() if field not in unbound})
+    expected = server.MASTER_PROMPTS[mode].format(**values)
+    assert bound.render({field: values[field] for field in unbound}) == expected
+    # Binding what is left gives the finished text
+    assert bound.bind(values).render({}) == expected
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('mode', server.MASTER_PROMPTS)
+async def test_matrix_matches_generate_prompt_for_every_combination(api, mode):
+    vary = {
+        'product': ['Plain', '{offer} {{braces}} }{'],
+        'offer': ['100% off {0}', 'Ünïcode — “quotes”'],
+        'video_len': [15, 60],
+    }
+    base = sample_payload(mode, **BRIEFS['braces'])
+    response = await api.post('/api/generate-prompts/matrix', json={'base': base, 'vary': vary})
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert len(results) == 8
+    for result in results:
+        assert result['ok']
+        request = server.PromptRequest(**{**base, **result['values']})
+        assert result['result']['generated_prompt'] == server.generate_prompt(request)
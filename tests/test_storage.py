@@ -0,0 +1,131 @@
+"""Contract every storage backend implements, run against the memory and SQLite backends"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from storage import Increment, Query
+
+pytestmark = pytest.mark.anyio
+
+START = datetime(2025, 3, 1, 12, 0)
+
+
+def prompt(number: int, minutes: int = None, **request_data) -> dict:
+    return {
+        'id': f'{number:03d}',
+        'timestamp': START + timedelta(minutes=number if minutes is None else minutes),
+        'mode': 'headlines' if number % 2 else 'visual_ad',
+        'request_data': {'product': f'Product {number}', 'market': 'US', **request_data},
+    }
+
+
+def ids(documents) -> list:
+    return [document['id'] for document in documents]
+
+
+def newest_first(documents) -> list:
+    return ids(sorted(documents, key=lambda document: (document['timestamp'], document['id']), reverse=True))
+
+
+async def test_find_page_walks_every_document_once_newest_first(storage):
+    # Pairs of documents share a timestamp, so pages must break ties by id
+    documents = [prompt(number, minutes=number // 2) for number in range(25)]
+    assert await storage.insert_many('prompts', documents) == []
+
+    seen = []
+    query = Query()
+    while True:
+        page = await storage.find_page('prompts', query, 4)
+        seen += ids(page)
+        if len(page) < 4:
+            break
+        query.after = (page[-1]['timestamp'], page[-1]['id'])
+    assert seen == newest_first(documents)
+
+
+async def test_find_page_filters(storage):
+    documents = [prompt(number) for number in range(10)]
+    documents[3]['request_data']['market'] = 'DE'
+    await storage.insert_many('prompts', documents)
+
+    headlines = await storage.find_page('prompts', Query(equals={'mode': 'headlines'}), 100)
+    assert ids(headlines) == newest_first(documents[1::2])
+    german = await storage.find_page('prompts', Query(equals={'request_data.market': 'DE'}), 100)
+    assert ids(german) == ['003']
+    # since is inclusive, until exclusive
+    window = Query(since=documents[2]['timestamp'], until=documents[6]['timestamp'])
+    assert ids(await storage.find_page('prompts', window, 100)) == ['005', '004', '003', '002']
+    after = Query(equals={'mode': 'visual_ad'}, after=(documents[6]['timestamp'], documents[6]['id']))
+    assert ids(await storage.find_page('prompts', after, 100)) == ['004', '002', '000']
+
+
+async def test_insert_many_reports_failed_documents_by_index(storage):
+    await storage.insert('prompts', prompt(1))
+    batch = [prompt(2), prompt(1), prompt(3), prompt(2)]
+    errors = await storage.insert_many('prompts', batch)
+    assert [index for index, _ in errors] == [1, 3]
+    assert all(isinstance(message, str) and message for _, message in errors)
+    assert ids(await storage.find_page('prompts', Query(), 100)) == ['003', '002', '001']
+
+
+async def test_concurrent_inserts_are_all_stored(storage):
+    await asyncio.gather(*(storage.insert('prompts', prompt(number)) for number in range(50)))
+    assert len(await storage.find_page('prompts', Query(), 100)) == 50
+
+
+async def test_increment_creates_then_updates_counters(storage):
+    first, later = START, START + timedelta(hours=1)
+    update = Increment(id='a', on_insert={'timestamp': START, 'name': 'first'}, inc={'count': 2},
+                       min={'first_seen': later}, max={'last_seen': first})
+    await storage.increment('counters', [update])
+    await storage.increment('counters', [
+        Increment(id='a', on_insert={'name': 'second'}, inc={'count': 3}, min={'first_seen': first}, max={'last_seen': later}),
+        Increment(id='b', on_insert={'timestamp': START}, inc={'count': -1}),
+    ])
+    counters = {counter['id']: counter for counter in await storage.find_in('counters', ['a', 'b'])}
+    assert counters['a']['count'] == 5
+    assert counters['a']['name'] == 'first'
+    assert counters['a']['first_seen'] == first
+    assert counters['a']['last_seen'] == later
+    assert counters['b']['count'] == -1
+
+
+async def test_move_before_moves_oldest_first_without_duplicates(storage):
+    documents = [prompt(number) for number in range(10)]
+    await storage.insert_many('prompts', documents)
+    # Left over from a move interrupted after copying
+    await storage.insert('prompts_archive', prompt(0))
+    cutoff = documents[6]['timestamp']
+
+    assert await storage.move_before('prompts', 'prompts_archive', cutoff, 4) == 4
+    assert ids(await storage.find_page('prompts', Query(), 100)) == newest_first(documents[4:])
+    assert await storage.move_before('prompts', 'prompts_archive', cutoff, 100) == 2
+    assert await storage.move_before('prompts', 'prompts_archive', cutoff, 100) == 0
+
+    assert ids(await storage.find_page('prompts', Query(), 100)) == newest_first(documents[6:])
+    assert ids(await storage.find_page('prompts_archive', Query(), 100)) == newest_first(documents[:6])
+
+
+async def test_search_ranks_by_field_weight_and_applies_filters(storage):
+    documents = [
+        prompt(1, product='Cold brew coffee'),
+        prompt(2, audience='Coffee lovers'),
+        prompt(3, product='Green tea'),
+        prompt(4, product='Coffee grinder'),
+    ]
+    # Written before the index exists, so creating it must index them
+    await storage.insert_many('prompts', documents[:2])
+    await storage.ensure_text_index('prompts', {'request_data.product': 10, 'request_data.audience': 1})
+    await storage.insert_many('prompts', documents[2:])
+
+    results = await storage.search('prompts', 'coffee', Query(), 10)
+    assert ids(document for _, document in results)[2] == '002'
+    assert set(ids(document for _, document in results)[:2]) == {'001', '004'}
+    scores = [score for score, _ in results]
+    assert scores == sorted(scores, reverse=True)
+
+    headlines = await storage.search('prompts', 'coffee', Query(equals={'mode': 'headlines'}), 10)
+    assert ids(document for _, document in headlines) == ['001']
+    assert len(await storage.search('prompts', 'coffee', Query(), 10, offset=2)) == 1
+    assert await storage.search('prompts', 'espresso', Query(), 10) == []
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import rebuild_usage
+import server
+from benchmarks.common import sample_payload
+from storage import Increment, Query
+from usage import day_start, usage_id
+
+pytestmark = pytest.mark.anyio
+
+TODAY = day_start(datetime.now(timezone.utc))
+
+
+def prompt(mode: str, days_ago: int, **brief) -> dict:
+    request = server.PromptRequest(**sample_payload(mode, **brief))
+    timestamp = TODAY - timedelta(days=days_ago) + timedelta(hours=12)
+    return server.prompt_document(
+        server.PromptResponse(mode=mode, generated_prompt='', timestamp=timestamp.replace(tzinfo=timezone.utc)), request)
+
+
+def counter(days_ago: int, dimension: str, value: str, count: int) -> Increment:
+    day = TODAY - timedelta(days=days_ago)
+    return Increment(
+        id=usage_id(day, dimension, value), on_insert={'timestamp': day, 'dimension': dimension, 'value': value},
+        inc={'count': count})
+
+
+async def market_counts(storage) -> dict:
+    counters = storage.stream('usage_daily', Query(equals={'dimension': 'market'}))
+    return {counter['id']: counter['count'] async for counter in counters}
+
+
+def market(days_ago: int, value: str) -> str:
+    return usage_id(TODAY - timedelta(days=days_ago), 'market', value)
+
+
+@pytest.fixture
+async def history(storage, monkeypatch):
+    """Prompts over a few past days and today, with counters that are wrong in every way the rebuild fixes"""
+    monkeypatch.setattr(server, 'storage', storage)
+    await storage.insert_many('prompts', [
+        prompt('headlines', 0, market='US'),
+        *[prompt('headlines', 2, market='DE') for _ in range(3)],
+        prompt('visual_ad', 2, market='US'),
+        *[prompt('visual_ad', 5, market='US') for _ in range(2)],
+    ])
+    await storage.increment('usage_daily', [
+        counter(0, 'market', 'US', 7),   # today: the API's to keep
+        counter(2, 'market', 'DE', 10),  # overcounted
+        counter(2, 'market', 'FR', 4),   # nothing to count any more
+        counter(40, 'market', 'XX', 9),  # a day with no prompts left
+        # day 5 was never counted
+    ])
+    return storage
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 1000])
+async def test_rebuild_recounts_past_days_and_zeroes_stale_ones(history, batch_size):
+    counts = await rebuild_usage.rebuild(batch_size, dry_run=False)
+    assert counts['prompts'] == 6
+    assert await market_counts(history) == {
+        market(0, 'US'): 7,
+        market(2, 'DE'): 3,
+        market(2, 'US'): 1,
+        market(2, 'FR'): 0,
+        market(5, 'US'): 2,
+        market(40, 'XX'): 0,
+    }
+    modes = history.stream('usage_daily', Query(equals={'dimension': 'mode'}))
+    modes = {counter['id']: counter['count'] async for counter in modes}
+    assert modes == {
+        usage_id(TODAY - timedelta(days=2), 'mode', 'headlines'): 3,
+        usage_id(TODAY - timedelta(days=2), 'mode', 'visual_ad'): 1,
+        usage_id(TODAY - timedelta(days=5), 'mode', 'visual_ad'): 2,
+    }
+
+    # Nothing left to correct
+    assert (await rebuild_usage.rebuild(batch_size, dry_run=False))['updates'] == 0
+
+
+async def test_dry_run_counts_without_writing(history):
+    before = await market_counts(history)
+    counts = await rebuild_usage.rebuild(2, dry_run=True)
+    assert counts['updates'] > 0
+    assert await market_counts(history) == before
+    assert (await rebuild_usage.rebuild(2, dry_run=False))['updates'] == counts['updates']
+
+
+async def test_rebuild_counts_archived_prompts(history):
+    assert await history.move_before('prompts', server.ARCHIVE_COLLECTION, TODAY - timedelta(days=4), 100) == 2
+    await rebuild_usage.rebuild(1000, dry_run=False)
+    assert (await market_counts(history))[market(5, 'US')] == 2
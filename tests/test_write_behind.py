@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from write_behind import WriteBehindFull, WriteBehindQueue
+
+pytestmark = pytest.mark.anyio
+
+
+class FlakyDatabase:
+    """Flush target that raises while `down`, and reports the ids in `duplicates` as rejected"""
+
+    def __init__(self, failures: int = 0, down: bool = False, duplicates=()):
+        self.failures = failures
+        self.down = down
+        self.duplicates = set(duplicates)
+        self.calls = 0
+        self.stored = []
+
+    async def flush(self, batch):
+        self.calls += 1
+        if self.down or self.calls <= self.failures:
+            raise ConnectionError("database unavailable")
+        rejected = [document for document in batch if document['id'] in self.duplicates]
+        self.stored += [document['id'] for document in batch if document not in rejected]
+        return len(rejected)
+
+
+def queue(database: FlakyDatabase, **options) -> WriteBehindQueue:
+    options = {'flush_size': 10, 'flush_interval': 0.01, 'retry_backoff': 0.001, 'max_retry_backoff': 0.01, **options}
+    return WriteBehindQueue(database.flush, **options)
+
+
+async def wait_until(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.005)
+
+
+async def test_failed_flush_is_retried_until_stored():
+    database = FlakyDatabase(failures=3)
+    writes = queue(database)
+    writes.start()
+    for number in range(5):
+        await writes.put({'id': number})
+    await wait_until(lambda: writes.flushed == 5)
+    assert database.stored == [0, 1, 2, 3, 4]
+    assert (writes.retries, writes.failed) == (3, 0)
+    await writes.close()
+
+
+async def test_documents_rejected_by_the_database_count_as_failed():
+    database = FlakyDatabase(duplicates={1, 3})
+    writes = queue(database)
+    writes.start()
+    for number in range(5):
+        await writes.put({'id': number})
+    await writes.close()
+    assert (writes.flushed, writes.failed) == (3, 2)
+
+
+async def test_failed_batch_is_stored_before_newer_documents():
+    database = FlakyDatabase(down=True)
+    writes = queue(database, flush_size=2)
+    writes.start()
+    await writes.put({'id': 0})
+    await writes.put({'id': 1})
+    await wait_until(lambda: writes.retries >= 2)
+    await writes.put({'id': 2})
+    database.down = False
+    await wait_until(lambda: writes.flushed == 3)
+    assert database.stored == [0, 1, 2]
+    await writes.close()
+
+
+async def test_outage_pushes_back_instead_of_losing_documents():
+    database = FlakyDatabase(down=True)
+    writes = queue(database, max_size=5, flush_size=2, put_timeout=0.01)
+    writes.start()
+    accepted = []
+    for number in range(20):
+        try:
+            await writes.put({'id': number})
+        except WriteBehindFull:
+            continue
+        accepted.append(number)
+    # The retrying batch plus a full queue; everything else was refused, not dropped
+    assert len(accepted) == 7
+    assert writes.rejected == 13
+    assert writes.failed == 0
+
+    database.down = False
+    await wait_until(lambda: writes.flushed == len(accepted))
+    assert database.stored == accepted
+    await writes.close()
+    assert writes.failed == 0
+
+
+async def test_close_flushes_everything_queued():
+    database = FlakyDatabase()
+    writes = queue(database, flush_interval=10)
+    writes.start()
+    for number in range(25):
+        await writes.put({'id': number})
+    await writes.close()
+    assert sorted(database.stored) == list(range(25))
+    assert writes.flushed == 25
+    assert not writes.running
+
+
+async def test_close_during_outage_gives_up_after_close_retries():
+    database = FlakyDatabase(down=True)
+    writes = queue(database, flush_size=2, max_retry_backoff=10, close_retries=2)
+    writes.start()
+    for number in range(6):
+        await writes.put({'id': number})
+    await wait_until(lambda: writes.retries >= 1)
+    calls = database.calls
+    await asyncio.wait_for(writes.close(), 1.0)
+    # The retrying batch gets close_retries more tries, the rest one each
+    assert database.calls - calls == 3 + 2
+    assert (writes.flushed, writes.failed) == (0, 6)